@@ -1,11 +1,31 @@
 """Summary
 """
 import os
-import requests
+import logging
 from xml.etree import ElementTree
 from configparser import ConfigParser
 import xmltodict
 
+from bdj_import.lib.helpers import session as default_session
+from bdj_import.lib.multipart import MultipartFile
+from bdj_import.lib.store import ResponseStore
+
+
+logger = logging.getLogger()
+
+
+class APIError(Exception):
+
+    """Error returned by the API
+
+    Attributes:
+        error_msg (str): Error message returned by the API
+    """
+
+    def __init__(self, error_msg):
+        self.error_msg = error_msg
+        super(APIError, self).__init__('API Error: {}'.format(error_msg))
+
 
 class API:
 
@@ -19,13 +39,34 @@ class API:
 
     endpoint = 'https://arpha.pensoft.net/api.php'
 
-    def __init__(self):
+    def __init__(self, session=None, endpoint=None, username=None, api_key=None,
+                 store=None, force=False):
         """Summary
+
+        Args:
+            session (requests.Session, optional): HTTP session - defaults
+                to the session shared with figure checks
+            endpoint (str, optional): API endpoint - e.g. a local stub server
+            username (str, optional): Username - defaults to config.cfg
+            api_key (str, optional): API key - defaults to config.cfg
+            store (ResponseStore, optional): Store of responses for documents
+                already validated / imported, keyed by content hash
+            force (bool, optional): Always send requests, even if the
+                document has a stored response
         """
-        config = ConfigParser()
-        config.read(os.path.join(os.path.dirname(__file__), 'config.cfg'))
-        self.username = config.get('credentials', 'username')
-        self.api_key = config.get('credentials', 'api_key')
+        self.session = session or default_session
+        self.store = store
+        self.force = force
+        if endpoint:
+            self.endpoint = endpoint
+        if username and api_key:
+            self.username = username
+            self.api_key = api_key
+        else:
+            config = ConfigParser()
+            config.read(os.path.join(os.path.dirname(__file__), 'config.cfg'))
+            self.username = config.get('credentials', 'username')
+            self.api_key = config.get('credentials', 'api_key')
 
     def authenticate(self):
         '''
@@ -33,23 +74,102 @@ class API:
         '''
         self.request(action='authenticate')
 
-    def validate_document(self, xml):
+    def validate_document(self, xml, digest=None):
         """Summary
 
         Args:
             xml (TYPE): Description
+            digest (str, optional): Content hash of the document, computed
+                as it was serialized - see Doc.serialize
         """
 
-        return self.request(action='validate_document', xml=xml)
+        return self._request_document('validate_document', xml, digest)
 
-    def import_document(self, xml):
+    def import_document(self, xml, digest=None):
         """Summary
 
         Args:
             xml (TYPE): Description
+            digest (str, optional): Content hash of the document, computed
+                as it was serialized - see Doc.serialize
+        """
+
+        return self._request_document('import_document', xml, digest)
+
+    def validate_file(self, path, digest=None):
+        """Validate document, streaming it from disk
+
+        Args:
+            path (str): Path to XML document
+            digest (str, optional): Content hash of the document
+        """
+
+        return self.request_file('validate_document', path, digest)
+
+    def import_file(self, path, digest=None):
+        """Import document, streaming it from disk
+
+        Args:
+            path (str): Path to XML document
+            digest (str, optional): Content hash of the document
+        """
+
+        return self.request_file('import_document', path, digest)
+
+    def _request_document(self, action, xml, digest=None):
+        if self.store and not digest:
+            digest = ResponseStore.digest(xml)
+        return self._stored(action, digest, lambda: self.request(action=action, xml=xml))
+
+    def _stored(self, action, digest, send):
+        """Return the stored response for a document, or send the request
+        and store a successful response
+
+        Args:
+            action (str): API action
+            digest (str): Content hash of the document
+            send (callable): Send the request
+
+        Returns:
+            TYPE: Description
+        """
+        if not self.store or not digest:
+            return send()
+        if not self.force:
+            response = self.store.get(digest, self.endpoint, self.username, action)
+            if response is not None:
+                logger.info("Document unchanged - using stored %s response", action)
+                return response
+        response = send()
+        self.store.add(digest, self.endpoint, self.username, action, response)
+        return response
+
+    def request_file(self, action, path, digest=None):
+        """Send a request, streaming the XML document from a file as a
+        multipart body - so memory use is constant regardless of size
+
+        Args:
+            action (str): API action
+            path (str): Path to XML document
+            digest (str, optional): Content hash of the document - if there
+                is a stored response for it, the request is skipped
+
+        Returns:
+            TYPE: Description
         """
+        return self._stored(action, digest, lambda: self._send_file(action, path))
 
-        return self.request(action='import_document', xml=xml)
+    def _send_file(self, action, path):
+        params = {
+            'action': action,
+            'username': self.username,
+            'api_key': self.api_key
+        }
+        with MultipartFile(params, 'xml', path) as body:
+            r = self.session.post(self.endpoint, data=body, headers={
+                'Content-Type': body.content_type
+            })
+        return self._parse_response(r)
 
     def request(self, **params):
         """Summary
@@ -61,16 +181,31 @@ class API:
             TYPE: Description
 
         Raises:
-            Exception: Description
+            APIError: The API returned an error
         """
         default_params = {
             'username': self.username,
             'api_key': self.api_key
         }
         params.update(default_params)
-        r = requests.post(self.endpoint, data=params)
+        r = self.session.post(self.endpoint, data=params)
+        return self._parse_response(r)
+
+    @staticmethod
+    def _parse_response(r):
+        """Summary
+
+        Args:
+            r (requests.Response): API response
+
+        Returns:
+            TYPE: Description
+
+        Raises:
+            APIError: The API returned an error
+        """
         r.raise_for_status()
         response = xmltodict.parse(r.content).get('result')
         if response['returnCode'] != '0':
-            raise Exception('API Error: {}'.format(response['errorMsg']))
+            raise APIError(response['errorMsg'])
         return response
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from bdj_import.doc import Doc
+from bdj_import.lib.builder import get_builder
+from bdj_import.lib.pipeline import Pipeline, Stage
+from bdj_import.lib.taxon_treatments import TaxonTreatments
+from bdj_import.lib.store import HashingWriter
+
+
+logger = logging.getLogger()
+
+
+class Dataset(object):
+    """
+    A dataset from the batch manifest - one paper
+
+    Source file names are relative to the package data directory, or
+    absolute paths
+    """
+
+    def __init__(self, title, output, authors=None,
+                 dwca='falklands-utf8.dwca.csv',
+                 descriptions='species-description-export.csv',
+                 images='image-export.csv',
+                 limit=None, family=None, taxon=None):
+        self.title = title
+        self.output = output
+        self.authors = authors
+        self.dwca = dwca
+        self.descriptions = descriptions
+        self.images = images
+        self.limit = limit
+        self.family = family
+        self.taxon = taxon
+
+    def __repr__(self):
+        return 'Dataset ({})'.format(self.title)
+
+
+class Batch(object):
+    """
+    Build several datasets in one process
+    The datasets share the worker pool - a process pool parsing species
+    descriptions, and threads checking figures - HTTP session, figure check
+    cache and parsed source files
+
+    Manifest is a JSON file of the form:
+        {"datasets": [{"title": "...", "output": "/tmp/paper.xml",
+                       "authors": [{"first_name": "...", ...}],
+                       "dwca": "...", "descriptions": "...", "images": "..."}]}
+    """
+
+    def __init__(self, manifest, workers=8, builder='etree', skip_images=False,
+                 material_aggregation=None, parse_workers=None):
+        with open(manifest) as f:
+            self.datasets = [Dataset(**d) for d in json.load(f)['datasets']]
+        self.builder = builder
+        self.skip_images = skip_images
+        self.material_aggregation = material_aggregation
+        # Number of concurrent figure checks
+        self.workers = workers
+        # Number of processes parsing species descriptions - 1 parses in
+        # process
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        # Shared pools, created by run()
+        self.figure_executor = None
+        self.parse_executor = None
+        # Parsed species descriptions & figures, keyed by file
+        self.cache = {}
+
+    def run(self, api=None, validate=False, upload=False):
+        """
+        Build each dataset, and optionally validate or upload it
+        Returns list of (dataset, response)
+        """
+        results = []
+        self.figure_executor = ThreadPoolExecutor(self.workers)
+        if self.parse_workers > 1:
+            self.parse_executor = ProcessPoolExecutor(self.parse_workers)
+        try:
+            for dataset in self.datasets:
+                results.append((dataset, self._run_dataset(
+                    dataset, api, validate, upload)))
+        finally:
+            self.figure_executor.shutdown()
+            if self.parse_executor:
+                self.parse_executor.shutdown()
+            self.figure_executor = self.parse_executor = None
+        return results
+
+    def _run_dataset(self, dataset, api, validate, upload):
+        start = time.time()
+
+        treatments = TaxonTreatments(
+            dwca_file=dataset.dwca,
+            descriptions_file=dataset.descriptions,
+            images_file=dataset.images,
+            cache=self.cache,
+            parse_workers=self.parse_workers,
+            executor=self.parse_executor,
+            lazy=True
+        )
+        parsed = time.time()
+
+        doc = Doc(dataset.title, dataset.limit, dataset.taxon, dataset.family,
+                  self.skip_images, get_builder(self.builder), bounded=True,
+                  material_aggregation=self.material_aggregation,
+                  authors=dataset.authors, treatments=treatments)
+
+        engine = Pipeline([
+            Stage('figures', doc.check_figures, workers=self.workers,
+                  executor=self.figure_executor),
+            Stage('build', doc.build_family_fragment, ordered=True),
+        ])
+        with open(dataset.output, 'wb') as f:
+            writer = HashingWriter(f)
+            doc.write(writer, engine.run(doc.iter_families()))
+            size = f.tell()
+        built = time.time()
+
+        response = None
+        if upload:
+            logger.warning("Exporting %s to BDJ.", dataset.title)
+            response = api.import_file(dataset.output, writer.digest)
+        elif validate:
+            logger.info("Validating %s.", dataset.title)
+            response = api.validate_file(dataset.output, writer.digest)
+
+        end = time.time()
+        logger.info(
+            "%s: %s treatments, %s bytes to %s; parse %.2fs, build %.2fs, "
+            "api %.2fs; %.1f treatments/s",
+            dataset.title, doc.treatment_count, size, dataset.output,
+            parsed - start, built - parsed, end - built,
+            doc.treatment_count / max(end - start, 1e-6)
+        )
+        return response
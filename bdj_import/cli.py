@@ -2,10 +2,22 @@
 import click
 import click_log
 import logging
+import os
+import tracemalloc
 from xml.dom import minidom
 
 from bdj_import.api import API
 from bdj_import.doc import Doc
+from bdj_import.batch import Batch
+from bdj_import.diagnose import Diagnose
+from bdj_import.lib.builder import get_builder, builders
+from bdj_import.lib.materials import aggregation_keys
+from bdj_import.lib.pipeline import Pipeline, Stage
+from bdj_import.lib.taxon_treatments import TaxonTreatments
+from bdj_import.lib.journal import Journal
+from bdj_import.lib.file import File
+from bdj_import.lib.store import ResponseStore, HashingWriter
+from bdj_import.lib.distribution import summarize_distributions
 
 logger = logging.getLogger()
 click_log.basic_config(logger)
@@ -18,19 +30,182 @@ click_log.basic_config(logger)
 @click.option('--output', '-o', default=None, type=click.Choice(['console', 'file', 'bdj']))
 @click.option('--family', '-f', default=None, help='Import specific family and child taxa.')
 @click.option('--taxon', '-t', default=None, help='Import specific taxon.')
+@click.option('--builder', '-b', default='etree', type=click.Choice(sorted(builders)), help='XML builder backend.')
+@click.option('--bounded', is_flag=True, help='Bounded memory - write treatments family by family to the output, without pretty printing.')
+@click.option('--max-memory', default=None, type=int, help='Memory ceiling (MB) for bounded builds, traced with tracemalloc.')
+@click.option('--aggregate-materials', '-a', multiple=True, type=click.Choice(list(aggregation_keys)), help='Collapse materials sharing these fields.')
+@click.option('--pipeline', '-p', is_flag=True, help='Check figures, build and write treatments concurrently (implies --bounded).')
+@click.option('--workers', '-w', default=8, type=int, help='Number of concurrent figure checks in pipeline mode.')
+@click.option('--manifest', '-m', default=None, type=click.Path(exists=True), help='Batch build the datasets in a JSON manifest.')
+@click.option('--parse-workers', default=None, type=int, help='Number of processes parsing descriptions (default: all cores).')
+@click.option('--journal', '-j', 'journal_path', default=None, type=click.Path(), help='Record job progress in this directory (implies --bounded).')
+@click.option('--resume', '-r', is_flag=True, help='Resume an interrupted job from its journal.')
+@click.option('--store', 'store_path', default='~/.cache/bdj-import/responses.json', type=click.Path(), help='Store of responses for unchanged documents - by default, validating or importing a document already validated / imported (by the same user) is skipped, and the stored response returned. Use --force to send it anyway.')
+@click.option('--force', is_flag=True, help='Validate / import even if the document is unchanged.')
+@click.option('--distribution', '-d', is_flag=True, help='Add distribution summaries to treatments.')
+@click.option('--distribution-csv', default=None, type=click.Path(), help='Output distribution summaries to a CSV file.')
+@click.option('--schema', default=None, type=click.Path(exists=True), help='Validate the document against an XML schema (XSD) in process - needs the lxml builder.')
+@click.option('--diagnose', is_flag=True, help='Find the treatments failing validation, by bisecting the document.')
 @click_log.simple_verbosity_option(logger)
-def main(limit, validate, output, family, taxon, skip_images):
+def main(limit, validate, output, family, taxon, skip_images, builder, bounded, max_memory,
+         aggregate_materials, pipeline, workers, manifest, parse_workers, journal_path,
+         resume, store_path, force, distribution, distribution_csv, schema, diagnose):
 
     response = None
-    doc = Doc('Marine Fauna and Flora of the Falkland Islands',
-              limit, taxon, family, skip_images)
-    api = API()
+    api = API(store=ResponseStore(os.path.expanduser(store_path)), force=force)
+    title = 'Marine Fauna and Flora of the Falkland Islands'
+    fpath = '/tmp/publication.xml'
+
+    if manifest:
+        batch = Batch(manifest, workers, builder, skip_images,
+                      aggregate_materials, parse_workers)
+        results = batch.run(api, validate, output == 'bdj')
+        for dataset, response in results:
+            if response:
+                print(dataset.title, response)
+        return
+
+    bounded = bounded or pipeline or bool(journal_path or resume)
+
+    if max_memory and not bounded:
+        raise click.UsageError('--max-memory only applies to bounded builds.')
+    if schema and (bounded or builder != 'lxml'):
+        raise click.UsageError('--schema needs the lxml builder, and an unbounded build.')
+    if bounded:
+        # The document is written as it is built
+        if not output and not validate:
+            raise click.UsageError('Bounded builds need an --output, or --validate.')
+        if output == 'console' and (validate or journal_path or resume):
+            raise click.UsageError(
+                'Bounded builds can only be validated or journalled from a file.')
+
+    journal = None
+    if journal_path or resume:
+        journal = Journal(
+            journal_path or '/tmp/bdj-import-journal',
+            dict(title=title, limit=limit, taxon=taxon, family=family,
+                 skip_images=skip_images, builder=builder,
+                 aggregate_materials=list(aggregate_materials),
+                 distribution=distribution, path=fpath,
+                 # Start again if the source exports have changed
+                 sources={name: File.signature(name) for name in [
+                     'falklands-utf8.dwca.csv',
+                     'species-description-export.csv',
+                     'image-export.csv',
+                 ]}),
+            resume
+        )
+
+    if max_memory:
+        tracemalloc.start()
+        max_memory = max_memory * 1024 * 1024
+
+    def load_treatments(lazy=False):
+        treatments = TaxonTreatments(parse_workers=parse_workers, lazy=lazy)
+        distributions = None
+        if distribution or distribution_csv:
+            distributions = summarize_distributions(treatments.values())
+            if distribution_csv:
+                with click.open_file(distribution_csv, 'w') as f:
+                    distributions.write_csv(f)
+                logger.info('Distributions output to %s', distribution_csv)
+        return treatments, distributions if distribution else None
+
+    if diagnose:
+        treatments, distributions = load_treatments()
+        # Sub-documents are always sent, and their responses not stored
+        diagnosis = Diagnose(API(), title, treatments, family, taxon, limit,
+                             skip_images=skip_images, builder=get_builder(builder),
+                             material_aggregation=aggregate_materials,
+                             distributions=distributions)
+        diagnosis.run()
+        diagnosis.report()
+        return
+
+    if bounded:
+
+        def build():
+            # Families are built as they are written
+            treatments, distributions = load_treatments(lazy=True)
+            doc = Doc(title, limit, taxon, family, skip_images, get_builder(builder),
+                      bounded=True, max_memory=max_memory,
+                      material_aggregation=aggregate_materials,
+                      treatments=treatments, journal=journal,
+                      distributions=distributions)
+            fragments = None
+            if pipeline:
+                # Figures are checked ahead, while treatments are built in
+                # order and written as they are ready
+                engine = Pipeline([
+                    Stage('figures', doc.check_figures, workers=workers),
+                    Stage('build', doc.build_family_fragment, ordered=True),
+                ])
+                fragments = engine.run(doc.iter_families())
+            if output == 'console':
+                doc.write(click.get_binary_stream('stdout'), fragments)
+                if pipeline:
+                    engine.report()
+                return {}
+            # The document is hashed as it is written
+            with click.open_file(fpath, 'wb') as f:
+                writer = HashingWriter(f)
+                doc.write(writer, fragments)
+            logger.info('Output to %s', fpath)
+            if pipeline:
+                engine.report()
+            return {'path': fpath, 'size': os.path.getsize(fpath),
+                    'digest': writer.digest}
+
+        def output_exists(result):
+            # Only skip the build if the output is still there
+            return os.path.exists(fpath) and os.path.getsize(fpath) == result['size']
+
+        if journal:
+            built = journal.run_stage('build', build, output_exists)
+        else:
+            built = build()
+
+        # Stream the document from disk
+        def upload():
+            logger.warning("Exporting to BDJ.")
+            return api.import_file(fpath, built.get('digest'))
+
+        def validate_file():
+            logger.info("Validating XML.")
+            return api.validate_file(fpath, built.get('digest'))
+
+        stage = None
+        if output == 'bdj':
+            stage = ('import', upload)
+        elif validate:
+            stage = ('validate', validate_file)
+        if stage:
+            response = journal.run_stage(*stage) if journal else stage[1]()
+        if response:
+            print(response)
+        return
+
+    treatments, distributions = load_treatments()
+    doc = Doc(title, limit, taxon, family, skip_images, get_builder(builder),
+              max_memory=max_memory, material_aggregation=aggregate_materials,
+              treatments=treatments, distributions=distributions)
+
+    if schema:
+        logger.info("Validating XML against %s.", schema)
+        errors = doc.builder.validate(doc.root, schema)
+        for error in errors:
+            logger.error(error)
+        if errors:
+            raise click.ClickException('Document is not valid against {}'.format(schema))
+
+    # The document is hashed as it is serialized
+    xml, digest = doc.serialize()
 
     if validate and not output == 'bdj':
         logger.info("Validating XML.")
-        response = api.validate_document(doc.xml)
+        response = api.validate_document(xml, digest)
 
-    pretty_xml = minidom.parseString(doc.xml).toprettyxml(indent="   ")
+    pretty_xml = minidom.parseString(xml).toprettyxml(indent="   ")
 
     if output:
         if output == 'file':
@@ -42,7 +217,7 @@ def main(limit, validate, output, family, taxon, skip_images):
             print(pretty_xml)
         else:
             logger.warning("Exporting to BDJ.")
-            response = api.import_document(doc.xml)
+            response = api.import_document(xml, digest)
 
     if response:
         print(response)
@@ -0,0 +1,156 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from bdj_import.api import APIError
+from bdj_import.doc import Doc
+from bdj_import.lib.family_treatment import FamilyTreatment
+from bdj_import.lib.taxon_treatments import TaxonTreatments
+
+
+logger = logging.getLogger()
+
+
+def treatment_subset(units):
+    """
+    A subset of parsed treatments, which can be passed to Doc
+    Built from a list of (family treatment, species treatment) units -
+    species None for the family treatment alone. Each family is copied, so
+    the subset holds just the selected species
+    """
+    families = {}
+    for family_treatment, species_treatment in units:
+        family = families.get(family_treatment.taxon)
+        if family is None:
+            family = families[family_treatment.taxon] = FamilyTreatment(
+                taxon=family_treatment.taxon,
+                description=family_treatment.description,
+                taxonomy=family_treatment.taxonomy,
+                figures=family_treatment.figures
+            )
+            family.materials = family_treatment.materials
+        if species_treatment:
+            family.add_species(species_treatment)
+    for family in families.values():
+        family.finalize()
+    return TaxonTreatments(families=families.values())
+
+
+class Diagnose(object):
+    """
+    Locate the treatments causing a document to fail validation
+
+    The treatments are bisected into self contained sub-documents, and
+    both halves are validated concurrently - recursing into the failing
+    halves until single treatments (or sets which only fail together)
+    remain, so the failures are found in a logarithmic number of calls
+    """
+
+    def __init__(self, api, title, treatments, family=None, taxon=None, limit=None,
+                 workers=2, **kwargs):
+        self.api = api
+        self.title = title
+        # Number of sub-documents validated concurrently
+        self.workers = workers
+        # Keyword arguments for building the sub-documents (see Doc)
+        self.kwargs = kwargs
+        self.units = self._select(treatments, family, taxon, limit)
+        # Number of validation requests
+        self.calls = 0
+        # List of (units, error message) - no units if the document fails
+        # without any treatments
+        self.failures = []
+
+    @staticmethod
+    def _select(treatments, family, taxon, limit):
+        """
+        List the selected treatments as (family, species) units
+        """
+        units = []
+        family_treatment = None
+        for treatment in treatments.iter_treatments(family, taxon, limit):
+            if isinstance(treatment, FamilyTreatment):
+                family_treatment = treatment
+                units.append((family_treatment, None))
+            else:
+                units.append((family_treatment, treatment))
+        return units
+
+    def validate(self, units):
+        """
+        Validate a sub-document of the units, returning the error message
+        or None if it is valid
+        """
+        doc = Doc(self.title, treatments=treatment_subset(units), **self.kwargs)
+        try:
+            self.api.validate_document(doc.xml)
+        except APIError as e:
+            return e.error_msg
+        return None
+
+    def run(self):
+        self.failures = []
+        with ThreadPoolExecutor(self.workers) as executor:
+            # The whole document, and the document without any treatments
+            error, empty_error = executor.map(self.validate, [self.units, []])
+            self.calls += 2
+            if not error:
+                logger.info("Document is valid.")
+                return self.failures
+            if empty_error:
+                self.failures.append(([], empty_error))
+                return self.failures
+
+            # Each round splits every failing set, and validates all of the
+            # halves together
+            failing = [(self.units, error)]
+            while failing:
+                splits = []
+                for units, error in failing:
+                    if len(units) == 1:
+                        self.failures.append((units, error))
+                    else:
+                        middle = len(units) // 2
+                        splits.append((units, error, units[:middle], units[middle:]))
+                halves = [half for split in splits for half in split[2:]]
+                errors = list(executor.map(self.validate, halves))
+                self.calls += len(halves)
+                failing = []
+                for i, (units, error, first, second) in enumerate(splits):
+                    first_error, second_error = errors[2 * i], errors[2 * i + 1]
+                    if first_error:
+                        failing.append((first, first_error))
+                    if second_error:
+                        failing.append((second, second_error))
+                    if not first_error and not second_error:
+                        # The treatments only fail together
+                        self.failures.append((units, error))
+
+        self.failures = self._exclude_family_failures(self.failures)
+        return self.failures
+
+    @staticmethod
+    def _exclude_family_failures(failures):
+        """
+        Species sub-documents include their family treatment, so if the
+        family fails alone, its species fail too - just report the family
+        """
+        families = set(
+            units[0][0].taxon for units, error in failures
+            if len(units) == 1 and units[0][1] is None
+        )
+        return [
+            (units, error) for units, error in failures
+            if not (len(units) == 1 and units[0][1] is not None and
+                    units[0][0].taxon in families)
+        ]
+
+    def report(self):
+        logger.info("%s validation requests for %s treatments.",
+                    self.calls, len(self.units))
+        for units, error in self.failures:
+            if not units:
+                logger.error("Document fails without treatments: %s", error)
+                continue
+            names = ', '.join(
+                species.taxon if species else family.taxon for family, species in units)
+            logger.error("Validation fails for %s: %s", names, error)
@@ -1,10 +1,15 @@
 
+import io
 import os
 import logging
-import xml.etree.cElementTree as ET
+import tracemalloc
 
-from bdj_import.lib.helpers import normalize, file_exists, ensure_list, soupify
+from bdj_import.lib.builder import get_builder
+from bdj_import.lib.helpers import normalize, file_exists, ensure_list
 from bdj_import.lib.taxon_treatments import TaxonTreatments
+from bdj_import.lib.materials import aggregate_materials
+from bdj_import.lib.mapping import compile_treatment_emitter, compile_material_emitter
+from bdj_import.lib.store import HashingWriter
 
 
 logger = logging.getLogger()
@@ -12,25 +17,71 @@ logger = logging.getLogger()
 
 class Doc:
 
-    def __init__(self, title, limit=None, taxon=None, family=None, skip_images=False):
+    # Default document authors
+    authors = [
+        dict(first_name='Ben', last_name='Scott', co_author='1',
+             email='b.scott@nhm.ac.uk', right='1', submitting_author='1'),
+    ]
+
+    def __init__(self, title, limit=None, taxon=None, family=None, skip_images=False,
+                 builder=None, bounded=False, max_memory=None,
+                 material_aggregation=None, authors=None, treatments=None,
+                 journal=None, distributions=None):
         self.title = title
+        # Element builder backend - defaults to xml.etree
+        self.builder = builder or get_builder()
+        # Field mappings are compiled once into emitter functions
+        self._emit_treatment_fields = compile_treatment_emitter(self.builder)
+        self._emit_material_fields = compile_material_emitter(self.builder)
         self.data_dir = os.path.join(os.path.dirname(
             __file__), 'data')
 
-        self.root = ET.Element("document")
+        self.root = self.builder.Element("document")
         self.limit = limit
         self.taxon = taxon
         self.skip_images = skip_images
         self.family = family
-
-        self.treatments = TaxonTreatments()
+        # In bounded mode treatments are built while the document is written
+        # and released afterwards - see write()
+        self.bounded = bounded
+        # Memory ceiling (bytes), checked in bounded mode once the sources
+        # have been read, and after each family. Treatments are then built
+        # lazily by default, so ingestion is bounded too - but treatments
+        # passed in fully parsed have already been read in full
+        self.max_memory = max_memory
+        self._written = False
+        # Number of species treatments built, for limit
+        self._count = 0
+        # Total number of treatments (family & species) built
+        self.treatment_count = 0
+        self._limit_reached = False
+        # Material aggregation keys (locality, event, depth, protocol) - if
+        # set, materials sharing these values are collapsed into one
+        self.material_aggregation = material_aggregation
+        # Optional job journal - families already built in a previous run
+        # are restored from it, rather than rebuilt
+        self.journal = journal
+        # Optional distribution summaries - if set, each treatment gets a
+        # distribution section
+        self.distributions = distributions
+
+        if authors:
+            self.authors = authors
+
+        # Treatments can be passed in, if they have been parsed already
+        if treatments is None:
+            treatments = TaxonTreatments(lazy=self.bounded)
+        self.treatments = treatments
+        if self.bounded:
+            self._check_memory()
         self._add_document_info()
         self._add_authors()
         self._add_objects()
         # After the objects (general structure has been created), we can
         # add the dependent metadata and treatments
         self._add_metadata()
-        self._add_taxon_treatments()
+        if not self.bounded:
+            self._add_taxon_treatments()
 
     def _add_document_info(self):
         # Create document info
@@ -45,8 +96,11 @@ class Doc:
         authors = self._add_elements(self.root, "authors")
         # We don't have many elements with lots of attributes so lets use
         # normal ET elements
-        ET.SubElement(authors, "author", first_name='Ben',
-                               last_name='Scott', co_author='1', email='b.scott@nhm.ac.uk', right='1', submitting_author='1')
+        for author in self.authors:
+            # Attribute values must be strings - manifest authors can have
+            # numeric values (e.g. "co_author": 1)
+            self.builder.SubElement(authors, "author", {
+                key: str(value) for key, value in author.items()})
 
     def _add_metadata(self):
 
@@ -58,14 +112,13 @@ class Doc:
             "value"
         ]).text = self.title
 
-    @staticmethod
-    def _add_elements(root, elements, text=None):
+    def _add_elements(self, root, elements, text=None):
         """
         Add list of elements
         Returns last element to be added
         """
         for element in ensure_list(elements):
-            el = ET.SubElement(root, element)
+            el = self.builder.SubElement(root, element)
         # If we have text, add it to the last element
         if text:
             el.text = text
@@ -111,85 +164,233 @@ class Doc:
     def _add_taxon_treatments(self):
 
         taxon_treatments = self.root.find('objects/taxon_treatments')
+
+        for family_treatment, treatment_els in self._iter_family_treatments():
+            taxon_treatments.extend(treatment_els)
+
+    def iter_families(self):
+        """
+        Yield the family treatments selected for the document
+        With a limit, iteration stops after the family reaching it - so
+        stages running ahead of the build (figure checks) stop there too
+        """
         count = 0
+        for family_treatment in self.treatments.iter_families(self.family):
+            yield family_treatment
+            count += len(family_treatment.list_species(self.taxon))
+            # The build stops (see _build_family_treatments) once a family
+            # takes the species count past the limit
+            if self.limit and count > self.limit:
+                return
+
+    def _iter_family_treatments(self):
+        """
+        Build the taxon treatments family by family
+        Yields the family treatment, and a list of the built treatment
+        elements (the family followed by its species)
+        """
+        for family_treatment in self.iter_families():
+            if self._limit_reached:
+                return
+            yield family_treatment, self._build_family_treatments(family_treatment)
+
+    def _build_family_treatments(self, family_treatment):
 
-        for family_treatment in self.treatments.values():
+        if self._limit_reached:
+            return []
 
-            if self.family:
-                if family_treatment.taxon.lower() != self.family.lower():
-                    continue
+        logger.debug("Processing family %s.", family_treatment.taxon)
 
-            logger.debug("Processing family %s.", family_treatment.taxon)
+        treatment_els = [self._build_taxon_treatment(family_treatment)]
 
-            treatment_el = self._build_taxon_treatment(family_treatment)
-            taxon_treatments.append(treatment_el)
+        for species_treatment in family_treatment.list_species(self.taxon):
+            if self.limit and self._count >= self.limit:
+                self._limit_reached = True
+                break
 
-            for species_treatment in family_treatment.list_species():
-                if self.limit and count >= self.limit:
-                    return
-                if self.taxon:
-                    if species_treatment.taxon != self.taxon:
-                        continue
+            logger.debug("Processing species %s.", species_treatment.taxon)
 
-                logger.debug("Processing species %s.", species_treatment.taxon)
+            treatment_els.append(
+                self._build_taxon_treatment(species_treatment))
+            self._count += 1
 
-                treatment_el = self._build_taxon_treatment(species_treatment)
-                taxon_treatments.append(treatment_el)
-                count += 1
+        return treatment_els
+
+    def iter_treatment_xml(self):
+        """
+        Yield (treatment, xml fragment) for each selected treatment as it is
+        built, releasing each family once it has been yielded
+        Figures, tables and citations referenced by the treatments are
+        added to the document
+        Only for bounded documents - otherwise the treatments have already
+        been built, and would be built (and their objects added) again
+        """
+        if not self.bounded:
+            raise Exception('Treatment XML can only be iterated for a bounded document')
+        for treatment in self.treatments.iter_treatments(
+                self.family, self.taxon, self.limit, release=True):
+            treatment_el = self._build_taxon_treatment(treatment)
+            yield treatment, self.builder.tostring(treatment_el)
+
+    def check_figures(self, family_treatment):
+        """
+        Check the figures of a family, and its selected species, exist
+        Results are cached, so this can be run ahead of building
+        """
+        if self.journal and self.journal.has_family(family_treatment.taxon):
+            return family_treatment
+        if not self.skip_images and not self._limit_reached:
+            treatments = [family_treatment] + \
+                list(family_treatment.list_species(self.taxon))
+            for treatment in treatments:
+                for figure in treatment.figures or []:
+                    file_exists(figure['path'])
+        return family_treatment
+
+    def build_family_fragment(self, family_treatment):
+        """
+        Build and serialize the treatments of a family
+        The family is released once it has been serialized
+        If the family is in the journal, it is restored rather than built
+        """
+        family = family_treatment.taxon
+        record = self.journal.get_family(family) if self.journal else None
+        if record:
+            logger.debug("Restoring family %s from journal.", family)
+            self._restore_family(record)
+        else:
+            record = self._build_family_record(family_treatment)
+            if self.journal:
+                self.journal.add_family(family, record)
+        # Release the family, and with it the parsed descriptions
+        # materials and built elements
+        del self.treatments[family]
+        self._check_memory()
+        return record['treatments'].encode('utf-8')
+
+    # Document objects populated while building treatments
+    _record_objects = [
+        ('figures', 'objects/figures'),
+        ('tables', 'objects/tables'),
+        ('citations', 'citations'),
+    ]
+
+    def _build_family_record(self, family_treatment):
+        """
+        Build a family, returning a record of the serialized treatments, and
+        the figures, tables and citations added to the document
+        """
+        objects = [(name, self.root.find(path)) for name, path in self._record_objects]
+        counts = [len(el) for name, el in objects]
+        treatment_count = self.treatment_count
+
+        treatment_els = self._build_family_treatments(family_treatment)
+
+        record = {
+            'treatments': self._serialize(treatment_els),
+            'count': self._count,
+            'limit_reached': self._limit_reached,
+            'treatment_count': self.treatment_count - treatment_count,
+        }
+        for (name, el), count in zip(objects, counts):
+            record[name] = self._serialize(list(el)[count:])
+        return record
+
+    def _restore_family(self, record):
+        """
+        Restore a family built in a previous run from its record
+        """
+        for name, path in self._record_objects:
+            fragment = '<fragment>{}</fragment>'.format(record[name])
+            self.root.find(path).extend(list(self.builder.fromstring(fragment)))
+        self._count = record['count']
+        self._limit_reached = record['limit_reached']
+        self.treatment_count += record['treatment_count']
+
+    def _serialize(self, elements):
+        return b''.join(self.builder.tostring(el) for el in elements).decode('utf-8')
+
+    def _iter_treatment_fragments(self):
+        for family_treatment in self.iter_families():
+            if self._limit_reached:
+                return
+            yield self.build_family_fragment(family_treatment)
+
+    def write(self, f, fragments=None):
+        """
+        Write the document to binary file object f
+        In bounded mode, the taxon treatments are built as they are written,
+        and each family's descriptions, materials and elements are released
+        once they have been output
+        Serialized treatment fragments can also be passed in - e.g. from a
+        pipeline running build_family_fragment
+        """
+        if self._written and self.bounded:
+            raise Exception('Bounded document has already been written')
+
+        if fragments is None and self.bounded:
+            fragments = self._iter_treatment_fragments()
+
+        f.write(b'<document>')
+        for el in self.root:
+            if el.tag != 'objects':
+                f.write(self.builder.tostring(el))
+                continue
+            f.write(b'<objects>')
+            # Objects after the taxon treatments (figures, tables) are
+            # populated while building treatments, so are written afterwards
+            for object_el in el:
+                if fragments is not None and object_el.tag == 'taxon_treatments':
+                    f.write(b'<taxon_treatments>')
+                    for fragment in fragments:
+                        f.write(fragment)
+                    f.write(b'</taxon_treatments>')
+                else:
+                    f.write(self.builder.tostring(object_el))
+            f.write(b'</objects>')
+        f.write(b'</document>')
+        self._written = True
+
+    def _check_memory(self):
+        """
+        Raise a MemoryError if traced memory exceeds the memory ceiling
+        Only applies if tracemalloc is tracing
+        """
+        if not self.max_memory or not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        logger.debug("Traced memory %s bytes (peak %s).", current, peak)
+        if current > self.max_memory:
+            raise MemoryError('Memory ceiling of {} bytes exceeded ({} bytes)'.format(
+                self.max_memory, current))
 
     def _build_taxon_treatment(self, treatment):
 
-        treatment_el = ET.Element('treatment')
+        self.treatment_count += 1
+        treatment_el = self.builder.Element('treatment')
         treatment_fields_el = self._add_elements(
             treatment_el, 'fields'
         )
 
-        self._add_nested_elements(treatment_fields_el,
-                                  ['classification', 'value'], treatment.taxon)
-        self._add_nested_elements(treatment_fields_el,
-                                  ['type_of_treatment', 'value'],
-                                  'Redescription or species observation'
-                                  )
+        self._emit_treatment_fields(treatment_fields_el, treatment)
 
-        self._add_nested_elements(
-            treatment_fields_el, ['rank', 'value'], 'Species')
+        materials = treatment.materials
+        if materials and self.material_aggregation:
+            materials = aggregate_materials(
+                materials, self.material_aggregation)
 
-        # Loop through all the taxonomic fields, and add them if they have a
-        # value
-        for taxonomic_field in ['species', 'genus', 'subgenus', 'taxon_authors']:
-            if hasattr(treatment, taxonomic_field) and getattr(treatment, taxonomic_field):
-                self._add_nested_elements(treatment_fields_el, [
-                    taxonomic_field, 'value'], getattr(treatment, taxonomic_field))
-
-        if treatment.materials:
+        if materials:
             # Add material fields
-            materials_el = ET.SubElement(treatment_el, "materials")
+            materials_el = self.builder.SubElement(treatment_el, "materials")
 
-            for material in treatment.materials:
+            for material in materials:
                 material_fields_el = self._add_nested_elements(
                     materials_el, ['material', 'fields']
                 )
-                self._add_nested_elements(material_fields_el,
-                                          ['type_status', 'value'], 'Other material'
-                                          )
-
-                # FIXME: This is very hacky
-                material_scientific_name = material.pop('scientificname')
-                name_parts = material_scientific_name.split(' ')
-                scientific_name_el = ET.Element("value")
-
-                self._add_elements(
-                    scientific_name_el, ['em'], ' '.join(name_parts[0:1]))
-                self._add_elements(
-                    scientific_name_el, ['span'], ' '.join([''] + name_parts[1:]))
-                self._add_elements(material_fields_el, ['scientificname']).append(
-                    scientific_name_el)
-
-                for fn, value in material.items():
-                    self._add_nested_elements(
-                        material_fields_el, [fn, 'value'], value)
+                self._emit_material_fields(material_fields_el, material)
 
-        notes = treatment.notes
+        # Copy, so the treatment's own notes are not extended
+        notes = list(treatment.notes)
 
         # Add any figures
         if treatment.figures and not self.skip_images:
@@ -205,6 +406,11 @@ class Doc:
             self._add_material_detail(treatment_el,
                                       'diagnosis', treatment.diagnosis)
 
+        if self.distributions:
+            distribution = self.distributions.describe(treatment)
+            if distribution:
+                self._add_material_detail(treatment_el, 'distribution', distribution)
+
         if notes:
             self._add_material_detail(treatment_el, 'notes', notes)
 
@@ -214,13 +420,13 @@ class Doc:
         el = self._add_nested_elements(
             root, [element_name, 'fields', element_name, 'value'])
         for p in paragraphs:
-            self._add_elements(el, 'p', normalize(p.getText()))
+            self._add_elements(el, 'p', normalize(p))
 
     def _add_tables(self, species_description):
         refs = []
         for table in species_description.tables:
             citation_ref = self._add_table(table)
-            refs.append(soupify('<p>[Table {}]</p>', citation_ref))
+            refs.append('[Table {}]'.format(citation_ref))
         return refs
 
     def _add_table(self, table):
@@ -230,13 +436,14 @@ class Doc:
         table_count = len(object_tables.findall('table'))
         table_id = table_count + 1
 
-        table_el = ET.SubElement(object_tables, "table", {'id': str(table_id)})
-        table_fields = ET.SubElement(table_el, "fields")
+        table_el = self.builder.SubElement(
+            object_tables, "table", {'id': str(table_id)})
+        table_fields = self.builder.SubElement(table_el, "fields")
 
         self._add_nested_elements(table_fields, ['table_caption', 'value'])
         self._add_nested_elements(
             table_fields, ['table_editor', 'value']).append(
-                ET.fromstring(str(table.prettify()))
+                self.builder.fromstring(table)
         )
         self._add_citation(table_id, 'tables')
         return table_id
@@ -245,9 +452,7 @@ class Doc:
         refs = []
         for figure in figures:
             citation_ref = self._add_figure(figure)
-            refs.append(
-                soupify('<p>[Figure {}]</p>', citation_ref)
-            )
+            refs.append('[Figure {}]'.format(citation_ref))
         return refs
 
     def _add_figure(self, figure):
@@ -262,7 +467,7 @@ class Doc:
         # figures we've added, and then use count as identifier
         figure_id = len(object_figures.findall('figure')) + 1
 
-        figure_el = ET.Element('figure', {'id': str(figure_id)})
+        figure_el = self.builder.Element('figure', {'id': str(figure_id)})
         self._add_nested_elements(
             figure_el, ['fields', 'figure_type', 'value']).text = 'Image'
         image_fields = self._add_nested_elements(
@@ -286,7 +491,7 @@ class Doc:
         citation_id = len(citations_el.findall('citation')) + 1
 
         # One citation per figure
-        citation_el = ET.SubElement(citations_el, 'citation', {
+        citation_el = self.builder.SubElement(citations_el, 'citation', {
             'id': str(citation_id)
         })
         self._add_elements(citation_el, ['object_id'], str(object_id))
@@ -295,4 +500,14 @@ class Doc:
 
     @property
     def xml(self):
-        return ET.tostring(self.root, method='xml')
+        return self.builder.tostring(self.root)
+
+    def serialize(self):
+        """
+        Serialize the document, hashing it as it is written
+        Returns (xml, digest)
+        """
+        f = io.BytesIO()
+        writer = HashingWriter(f)
+        self.builder.write(self.root, writer)
+        return f.getvalue(), writer.digest
@@ -0,0 +1,77 @@
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+
+class Builder(object):
+    """
+    Thin wrapper around an ElementTree compatible module
+    So the document can be built with either xml.etree or lxml
+    """
+
+    name = None
+
+    def __init__(self, etree):
+        self.etree = etree
+
+    def Element(self, tag, attrib={}, **extra):
+        return self.etree.Element(tag, attrib, **extra)
+
+    def SubElement(self, parent, tag, attrib={}, **extra):
+        return self.etree.SubElement(parent, tag, attrib, **extra)
+
+    def fromstring(self, text):
+        return self.etree.fromstring(text)
+
+    def tostring(self, element):
+        return self.etree.tostring(element, method='xml')
+
+    def write(self, element, f):
+        """
+        Serialize element to a binary file object - as tostring()
+        """
+        self.etree.ElementTree(element).write(f, method='xml')
+
+
+class ElementTreeBuilder(Builder):
+
+    name = 'etree'
+
+    def __init__(self):
+        super(ElementTreeBuilder, self).__init__(ET)
+
+
+class LXMLBuilder(Builder):
+
+    name = 'lxml'
+
+    def __init__(self):
+        from lxml import etree
+        super(LXMLBuilder, self).__init__(etree)
+
+    def validate(self, element, xsd_path):
+        """
+        Validate element against an XML schema, without serializing
+        Returns a list of error messages - empty if the element is valid
+        """
+        schema = self.etree.XMLSchema(self.etree.parse(xsd_path))
+        if schema.validate(element):
+            return []
+        return [str(error) for error in schema.error_log]
+
+
+builders = {
+    ElementTreeBuilder.name: ElementTreeBuilder,
+    LXMLBuilder.name: LXMLBuilder,
+}
+
+
+def get_builder(name='etree'):
+    """
+    Return a builder instance by name (etree or lxml)
+    """
+    try:
+        return builders[name]()
+    except KeyError:
+        raise ValueError('Unknown builder {}'.format(name))
@@ -1,22 +1,103 @@
+from bs4 import BeautifulSoup, Tag
 
 
-from bs4 import BeautifulSoup, Tag
+# Fields species description bodies are split into
+field_names = ['voucher', 'diagnosis', 'remarks']
+
+
+def parse_body(body):
+    """
+    Parse raw description body html
+    Runs in worker processes, so returns compact, picklable results:
+    paragraph text, table html and the paragraph text split into
+    voucher, diagnosis & remarks fields
+    """
+    tables = []
+    paragraphs = []
+    soup = BeautifulSoup(body, "html.parser")
+    for el in soup.find_all(["p", "table"], recursive=False):
+        l = tables if el.name == 'table' else paragraphs
+        # Remove all embedded images - these cannot be included in the xml
+        [x.extract() for x in el.findAll('img')]
+        l.append(el)
+
+    return {
+        # Full paragraph text, including the voucher, diagnosis & remarks
+        # labels. Taken before splitting, which removes the labels - so
+        # family notes no longer depend on whether a species sharing the
+        # description was split first (which left notes like ". ..." and
+        # emptied paragraphs which were just a label)
+        'paragraphs': [p.getText() for p in paragraphs],
+        'tables': [str(table.prettify()) for table in tables],
+        'fields': _parse_fields(paragraphs),
+    }
+
+
+def _parse_fields(paragraphs):
+    """
+    Parse body text, splitting into voucher diagnosis & remarks
+    """
+    fields = {}
+    # The body contains the taxonomy in headers at the top
+    # Which needs to be stripped out, otherwise will duplicate data in
+    # publication proper - so match the strong content
+    # If we match on classification, we end up stripping out content from later in the
+    # process e.g. tables with taxonomy in the description
+    # instead we wait until the first paragraph matching Voucher, Diagnosis or Remarks
+    # and discard all previous paragraphs
+
+    # Loop through all of the strong tags, and see if it's voucher, diagnosis etc.,
+    # If it is, then set the current field - used to key
+    current_field = None
+    for p in paragraphs:
+        for strong in p.find_all("strong"):
+            strong_text = strong.getText().lower()
+            for field_name in field_names:
+                if _is_label(field_name, strong_text):
+                    current_field = field_name
+                    # Remove the strong label text
+                    strong.extract()
+
+        if current_field:
+            fields.setdefault(current_field, []).append(p.getText())
+
+    return fields
+
+
+def _is_label(field_name, strong_text):
+    """
+    Is the strong text a field label - the shorter of the two contained in
+    the other. This is the match fuzz.partial_ratio(field_name, strong_text)
+    > 99 made, which cost a SequenceMatcher per strong tag and field - most
+    of the parse time, now every description is split
+    """
+    if not strong_text:
+        return False
+    if len(field_name) <= len(strong_text):
+        return field_name in strong_text
+    return strong_text in field_name
 
 
 class Description(object):
     """
     Class for storing species description
     Text will be separated out into tables and paragraphs
+    Body can be passed in already parsed - see parse_body
     """
 
-    def __init__(self, tid, body, index, scientific_name, rank):
-        self.tables = []
-        self.paragraphs = []
+    def __init__(self, tid, body, index, scientific_name, rank, parsed=None):
         self.tid = tid
         self.index = index
         self.scientific_name = scientific_name
         self.rank = rank
-        self._parse_body(body)
+        if parsed is None:
+            parsed = parse_body(body)
+        # Paragraph text
+        self.paragraphs = parsed['paragraphs']
+        # Table html
+        self.tables = parsed['tables']
+        # Paragraph text split into voucher, diagnosis & remarks
+        self.fields = parsed['fields']
 
     def matches(self, lookup, rank=None):
         """
@@ -28,15 +109,3 @@ class Description(object):
             if lookup in idx:
                 return True
         return False
-
-    def _parse_body(self, body):
-        """
-        Loop through the raw body text
-        If it's a table move it into _tables property,other add to _paragraphs
-        """
-        soup = BeautifulSoup(body, "html.parser")
-        for el in soup.find_all(["p", "table"], recursive=False):
-            l = self.tables if el.name == 'table' else self.paragraphs
-            # Remove all embedded images - these cannot be included in the xml
-            [x.extract() for x in el.findAll('img')]
-            l.append(el)
@@ -0,0 +1,291 @@
+import re
+import csv
+import math
+import functools
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+from bdj_import.lib.family_treatment import FamilyTreatment
+
+
+class Occurrences(object):
+    """
+    Occurrence columns of a treatment's materials - latitude, longitude,
+    depth and event date (days since 1970-01-01), NaN where missing
+    Collected as compact arrays during ingestion, and summarised with
+    numpy in one pass over all treatments - see summarize_distributions()
+    """
+
+    columns = ['latitude', 'longitude', 'depth', 'date']
+
+    __slots__ = columns
+
+    def __init__(self):
+        self.latitude = array('d')
+        self.longitude = array('d')
+        self.depth = array('d')
+        self.date = array('d')
+
+    def __len__(self):
+        return len(self.latitude)
+
+    def add(self, data):
+        """
+        Add an occurrence from a DwC-A row
+        """
+        self.latitude.append(_to_float(data.get('decimalLatitude')))
+        self.longitude.append(_to_float(data.get('decimalLongitude')))
+        self.depth.append(_to_float(data.get('maximumDepthInMeters')))
+        self.date.append(_to_days(data.get('eventDate')))
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+# Day first dates, as in the Falklands export (23/04/2012)
+day_first_date = re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{4})')
+
+
+@functools.lru_cache(maxsize=4096)
+def _to_days(value):
+    # Event dates can be date times or intervals (2011-02-12/2011-02-14)
+    # - use the start date
+    if not value:
+        return math.nan
+    value = value.strip()
+    m = day_first_date.match(value)
+    if m:
+        day, month, year = m.groups()
+        value = '{}-{:0>2}-{:0>2}'.format(year, month, day)
+    try:
+        days = np.datetime64(value.split('/')[0][:10], 'D')
+    except (TypeError, ValueError):
+        return math.nan
+    # Empty & NaT strings parse to NaT rather than raising
+    if np.isnat(days):
+        return math.nan
+    return float(days.astype('int64'))
+
+
+class Distributions(object):
+    """
+    Distribution summaries - record count, bounding box, depth & date
+    ranges and gridded occurrence counts - of families and species
+    Keyed by (family, taxon), with taxon None for the family itself
+    """
+
+    fields = [
+        'family',
+        'taxon',
+        'records',
+        'min_latitude',
+        'max_latitude',
+        'min_longitude',
+        'max_longitude',
+        'min_depth',
+        'max_depth',
+        'first_date',
+        'last_date',
+        'grid_cells',
+        'grid',
+    ]
+
+    def __init__(self, grid_size=1.0):
+        # Size of grid cells, in degrees
+        self.grid_size = grid_size
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        return iter(self._data.values())
+
+    def get(self, treatment):
+        """
+        Return the summary for a family or species treatment, or None
+        """
+        if isinstance(treatment, FamilyTreatment):
+            return self._data.get((treatment.taxon, None))
+        return self._data.get((treatment.taxonomy.get('family'), treatment.taxon))
+
+    def add(self, summary):
+        self._data[(summary['family'], summary['taxon'])] = summary
+
+    def write_csv(self, f):
+        writer = csv.DictWriter(f, self.fields)
+        writer.writeheader()
+        for summary in self:
+            row = dict(summary)
+            row['grid'] = '; '.join(
+                '{:g},{:g}={}'.format(lat, lon, count) for lat, lon, count in summary['grid'])
+            writer.writerow(row)
+
+    def describe(self, treatment):
+        """
+        Distribution text for a treatment, as a list of paragraphs
+        """
+        summary = self.get(treatment)
+        if not summary:
+            return []
+        text = '{} record{}'.format(summary['records'], '' if summary['records'] == 1 else 's')
+        if summary['grid_cells']:
+            text += ' in {} grid cell{} ({:g}°)'.format(
+                summary['grid_cells'], '' if summary['grid_cells'] == 1 else 's',
+                self.grid_size)
+        parts = []
+        if summary['min_latitude'] is not None:
+            parts.append('{} to {}, {} to {}'.format(
+                _format_coordinate(summary['min_latitude'], 'N', 'S'),
+                _format_coordinate(summary['max_latitude'], 'N', 'S'),
+                _format_coordinate(summary['min_longitude'], 'E', 'W'),
+                _format_coordinate(summary['max_longitude'], 'E', 'W'),
+            ))
+        if summary['min_depth'] is not None:
+            parts.append('depth {} m'.format(_format_range(
+                '{:g}'.format(summary['min_depth']), '{:g}'.format(summary['max_depth']))))
+        if summary['first_date']:
+            parts.append('collected {}'.format(
+                _format_range(summary['first_date'], summary['last_date'], ' to ')))
+        if parts:
+            text += ': ' + '; '.join(parts)
+        return [text + '.']
+
+
+def _format_coordinate(value, positive, negative):
+    return '{:g}°{}'.format(abs(value), positive if value >= 0 else negative)
+
+
+def _format_range(minimum, maximum, separator='–'):
+    if minimum == maximum:
+        return minimum
+    return '{}{}{}'.format(minimum, separator, maximum)
+
+
+def summarize_distributions(family_treatments, grid_size=1.0):
+    """
+    Summarise the occurrences of every species and family treatment
+
+    Occurrence arrays are concatenated in treatment order, so each
+    species (and each family) is a contiguous segment, and every summary
+    is computed with one vectorised reduction over all records
+    """
+    distributions = Distributions(grid_size)
+    keys = []
+    family_names = []
+    family_index = []
+    columns = {c: [] for c in Occurrences.columns}
+    for family_treatment in family_treatments:
+        family_names.append(family_treatment.taxon)
+        for species_treatment in family_treatment.list_species():
+            keys.append((family_treatment.taxon, species_treatment.taxon))
+            family_index.append(len(family_names) - 1)
+            occurrences = species_treatment.occurrences
+            for c in Occurrences.columns:
+                columns[c].append(np.frombuffer(getattr(occurrences, c), dtype=np.float64))
+
+    if not keys:
+        return distributions
+
+    values = {c: np.concatenate(columns[c]) for c in Occurrences.columns}
+    lengths = np.array([len(a) for a in columns['latitude']], dtype=np.int64)
+    species_ids = np.repeat(np.arange(len(keys)), lengths)
+    family_lengths = np.bincount(family_index, weights=lengths,
+                                 minlength=len(family_names)).astype(np.int64)
+    family_ids = np.repeat(np.arange(len(family_names)), family_lengths)
+
+    family_summaries = _summarize(values, family_ids, family_lengths, grid_size)
+    species_summaries = iter(zip(keys, _summarize(values, species_ids, lengths, grid_size)))
+    species_counts = np.bincount(family_index, minlength=len(family_names)).tolist()
+
+    # Each family, followed by its species
+    for family, summary, count in zip(family_names, family_summaries, species_counts):
+        summary.update(family=family, taxon=None)
+        distributions.add(summary)
+        for _ in range(count):
+            (family, taxon), summary = next(species_summaries)
+            summary.update(family=family, taxon=taxon)
+            distributions.add(summary)
+    return distributions
+
+
+def _summarize(values, ids, lengths, grid_size):
+    """
+    Summarise contiguous segments of the occurrence columns
+    ids gives the segment of each record, lengths the size of each segment
+    """
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    ranges = {}
+    for c in Occurrences.columns:
+        ranges[c] = (_reduce(np.fmin, values[c], starts, lengths),
+                     _reduce(np.fmax, values[c], starts, lengths))
+    grids = _grid_counts(values['latitude'], values['longitude'], ids,
+                         len(lengths), grid_size)
+
+    summaries = []
+    for i, records in enumerate(lengths.tolist()):
+        summary = OrderedDict(records=records)
+        for c in ['latitude', 'longitude', 'depth']:
+            summary['min_' + c] = _value(ranges[c][0][i])
+            summary['max_' + c] = _value(ranges[c][1][i])
+        summary['first_date'] = _date(ranges['date'][0][i])
+        summary['last_date'] = _date(ranges['date'][1][i])
+        summary['grid_cells'] = len(grids[i])
+        summary['grid'] = grids[i]
+        summaries.append(summary)
+    return summaries
+
+
+def _reduce(ufunc, values, starts, lengths):
+    """
+    Reduce each segment with a NaN ignoring ufunc (fmin / fmax) - segments
+    with no values are NaN
+    """
+    result = np.full(len(starts), np.nan)
+    nonempty = lengths > 0
+    if nonempty.any():
+        result[nonempty] = ufunc.reduceat(values, starts[nonempty])
+    return result
+
+
+def _grid_counts(latitude, longitude, ids, count, grid_size):
+    """
+    Count the occurrences in each grid cell of each segment
+    Returns a list (per segment) of (latitude, longitude, count) tuples,
+    cells identified by their south west corner
+    """
+    grids = [[] for _ in range(count)]
+    valid = ~(np.isnan(latitude) | np.isnan(longitude))
+    if not valid.any():
+        return grids
+    rows = np.floor(latitude[valid] / grid_size).astype(np.int64)
+    cols = np.floor(longitude[valid] / grid_size).astype(np.int64)
+    # Encode segment, row & column as a single key, so cells are counted
+    # with one unique
+    row_min, col_min = rows.min(), cols.min()
+    n_rows = rows.max() - row_min + 1
+    n_cols = cols.max() - col_min + 1
+    keys = (ids[valid] * n_rows + (rows - row_min)) * n_cols + (cols - col_min)
+    keys, counts = np.unique(keys, return_counts=True)
+    cell_ids, cells = np.divmod(keys, n_rows * n_cols)
+    cell_rows, cell_cols = np.divmod(cells, n_cols)
+    for i, row, col, n in zip(cell_ids.tolist(), (cell_rows + row_min).tolist(),
+                              (cell_cols + col_min).tolist(), counts.tolist()):
+        grids[i].append((row * grid_size, col * grid_size, n))
+    return grids
+
+
+def _value(value):
+    return None if np.isnan(value) else float(value)
+
+
+def _date(value):
+    if np.isnan(value):
+        return None
+    return str(np.datetime64(int(value), 'D'))
@@ -1,11 +1,12 @@
 from bdj_import.lib.treatment import Treatment
-from sortedcontainers import SortedDict
 
 
 class FamilyTreatment(Treatment):
 
+    __slots__ = ['species_treatments', 'taxon_authors', 'notes']
+
     def __init__(self, **kwargs):
-        self.species_treatments = SortedDict()
+        self.species_treatments = {}
         super(FamilyTreatment, self).__init__(**kwargs)
 
     def add_species(self, species):
@@ -14,17 +15,22 @@ class FamilyTreatment(Treatment):
     def get_species(self, taxon):
         return self.species_treatments.get(taxon, None)
 
-    def list_species(self):
+    def list_species(self, taxon=None):
+        """
+        List species treatments, optionally just the matching taxon
+        """
+        if taxon:
+            return [s for s in self.species_treatments.values() if s.taxon == taxon]
         return self.species_treatments.values()
 
-    @property
-    def taxon_authors(self):
+    def finalize(self):
         """
-        Include the full scientific name in the taxon authors field
-        So that it is completely unitalicized
+        Sort the species treatments by taxon, and finalize them
         """
-        return self.description.scientific_name
-
-    @property
-    def notes(self):
-        return self.description.paragraphs
+        self.species_treatments = dict(sorted(self.species_treatments.items()))
+        for species_treatment in self.species_treatments.values():
+            species_treatment.finalize()
+        # Include the full scientific name in the taxon authors field
+        # So that it is completely unitalicized
+        self.taxon_authors = self.description.scientific_name if self.description else None
+        self.notes = self.description.paragraphs if self.description else []
@@ -8,10 +8,10 @@ class Figures(object):
     """
     Extract data from the exported image files
     """
-    _data = {}
 
-    def __init__(self):
-        for row in File('image-export.csv'):
+    def __init__(self, file_name='image-export.csv'):
+        self._data = {}
+        for row in File(file_name):
             self._data.setdefault(row['TID'], []).append(
                 {
                     'description': row['Description'],
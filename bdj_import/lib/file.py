@@ -1,4 +1,5 @@
 import csv
+import io
 import os
 import sys
 import pkg_resources
@@ -7,18 +8,85 @@ import pkg_resources
 class File(object):
 
     def __init__(self, file_name):
-        dir = os.path.abspath(
-            pkg_resources.resource_filename('bdj_import', 'data'))
-
-        f = open(os.path.join(dir, file_name), 'r')
+        self.path = self.get_path(file_name)
+        f = open(self.path, 'r')
         self.reader = csv.DictReader(f)
 
     def __iter__(self):
         return self
 
+    @staticmethod
+    def get_path(file_name):
+        # Absolute paths are used as is, otherwise files are in the package data
+        if os.path.isabs(file_name):
+            return file_name
+        dir = os.path.abspath(
+            pkg_resources.resource_filename('bdj_import', 'data'))
+        return os.path.join(dir, file_name)
+
+    @classmethod
+    def signature(cls, file_name):
+        """
+        Size & modification time of a file, as a list - so it is unchanged
+        by a JSON round trip
+        """
+        stat = os.stat(cls.get_path(file_name))
+        return [stat.st_size, stat.st_mtime_ns]
+
     def __next__(self):
         return next(self.reader)
 
+    def iter_offsets(self):
+        """
+        Yield (offset, row) for every row - the offset is the position of
+        the row in the file, so it can be read again with read_rows()
+        """
+        with open(self.path, 'r', newline='') as f:
+            records = self._iter_records(f)
+            _, header = next(records)
+            fieldnames = self._parse_record(header)
+            for offset, record in records:
+                values = self._parse_record(record)
+                # Skip blank lines, as DictReader does
+                if values:
+                    yield offset, dict(zip(fieldnames, values))
+
+    def read_rows(self, offsets):
+        """
+        Yield the rows at the offsets
+        """
+        with open(self.path, 'r', newline='') as f:
+            fieldnames = self._parse_record(next(self._iter_records(f))[1])
+            for offset in offsets:
+                f.seek(offset)
+                yield dict(zip(fieldnames, self._parse_record(next(self._iter_records(f))[1])))
+
+    @staticmethod
+    def _iter_records(f):
+        """
+        Yield (offset, text) of each CSV record - a record spans several lines
+        if a quoted value contains new lines, so read lines until the quotes
+        are balanced
+        The file must be opened with newline='', so lines ending in \r, \n
+        or \r\n are read untranslated
+        """
+        offset = f.tell()
+        lines = []
+        quotes = 0
+        for line in iter(f.readline, ''):
+            lines.append(line)
+            quotes += line.count('"')
+            if quotes % 2 == 0:
+                yield offset, ''.join(lines)
+                offset = f.tell()
+                lines = []
+                quotes = 0
+
+    @staticmethod
+    def _parse_record(text):
+        # Translate line endings, as reading in text mode does
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return next(csv.reader(io.StringIO(text, newline='')), [])
 
 if __name__ == '__main__':
     file = File('falklands-utf8.dwca.csv')
@@ -4,7 +4,9 @@
 # @Last Modified by:   benscott
 # @Last Modified time: 2018-01-24 09:51:03
 
+import os
 import re
+import tempfile
 import unicodedata
 import requests
 from bs4 import BeautifulSoup
@@ -14,10 +16,25 @@ def normalize(s):
     return unicodedata.normalize("NFKD", s).strip()
 
 
+# HTTP session shared by figure checks and the API, so connections are
+# reused across requests - with enough pooled connections for concurrent
+# figure checks
+session = requests.Session()
+session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=32))
+session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=32))
+
+# Cache of URL => exists, so figures are only checked once
+_file_exists_cache = {}
+
+
 def file_exists(url):
-    r = requests.head(url)
-    r.headers
-    return r.status_code == 200
+    try:
+        return _file_exists_cache[url]
+    except KeyError:
+        pass
+    r = session.head(url)
+    exists = _file_exists_cache[url] = r.status_code == 200
+    return exists
 
 
 def strip_parenthesis(s):
@@ -38,6 +55,25 @@ def soupify(html, vars=[]):
 #     return '<div>%s</div>' % soup.prettify()
 
 
+def write_atomic(path, data):
+    """
+    Write data to path atomically - data is written to a temporary file
+    which is synced to disk and then renamed over path, so the file is
+    never left partially written if the process crashes
+    """
+    dir_name = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
 def ensure_list(v):
     # Ensure elements is a list
     return v if type(v) is list else [v]
@@ -0,0 +1,121 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+
+from bdj_import.lib.helpers import write_atomic
+
+
+logger = logging.getLogger()
+
+
+class Journal(object):
+    """
+    Persistent journal of an import job, recording completed stages and
+    per-family results (built fragments, validation & upload responses)
+    so an interrupted job can be resumed
+
+    Family records are written before the index which references them,
+    and every file is written atomically, so the journal stays consistent
+    if the process crashes mid-write
+
+    The journal only ever deletes the files it owns (the index and family
+    records), and refuses to use a non-empty directory without an index
+    """
+
+    index_file = 'journal.json'
+
+    def __init__(self, path, params, resume=False):
+        self.path = path
+        if (os.path.isdir(path) and os.listdir(path) and
+                not os.path.exists(os.path.join(path, self.index_file))):
+            raise Exception('{} is not empty, and is not a journal'.format(path))
+        # Job parameters - a journal is only resumed for the same job
+        self.params = params
+        self._lock = threading.Lock()
+        self._index = None
+        if resume:
+            self._index = self._load()
+        if self._index is None:
+            self.reset()
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.path, self.index_file)) as f:
+                index = json.load(f)
+        except (IOError, ValueError):
+            logger.info("No journal to resume in %s", self.path)
+            return None
+        if index.get('params') != self.params:
+            logger.warning("Journal in %s is for a different job - starting again", self.path)
+            return None
+        logger.info("Resuming job: %s families and stages %s completed",
+                    len(index['families']), list(index['stages']))
+        return index
+
+    def reset(self):
+        """
+        Clear the journal, and start a new job
+        """
+        families_dir = os.path.join(self.path, 'families')
+        if os.path.isdir(families_dir):
+            for file_name in os.listdir(families_dir):
+                if file_name.endswith('.json'):
+                    os.remove(os.path.join(families_dir, file_name))
+        else:
+            os.makedirs(families_dir)
+        self._index = {'params': self.params, 'families': {}, 'stages': {}}
+        self._save()
+
+    def _save(self):
+        write_atomic(os.path.join(self.path, self.index_file),
+                     json.dumps(self._index).encode('utf-8'))
+
+    def has_family(self, family):
+        return family in self._index['families']
+
+    def get_family(self, family):
+        """
+        Return the recorded result for a family, or None
+        """
+        file_name = self._index['families'].get(family)
+        if not file_name:
+            return None
+        with open(os.path.join(self.path, 'families', file_name)) as f:
+            return json.load(f)
+
+    def add_family(self, family, record):
+        """
+        Record the result (a JSON serializable dict) for a family
+        """
+        file_name = hashlib.sha1(family.encode('utf-8')).hexdigest() + '.json'
+        write_atomic(os.path.join(self.path, 'families', file_name),
+                     json.dumps(record).encode('utf-8'))
+        with self._lock:
+            self._index['families'][family] = file_name
+            self._save()
+
+    def get_stage(self, stage):
+        """
+        Return the recorded result of a completed stage, or None
+        """
+        return self._index['stages'].get(stage)
+
+    def complete_stage(self, stage, result):
+        with self._lock:
+            self._index['stages'][stage] = result
+            self._save()
+
+    def run_stage(self, stage, fn, valid=None):
+        """
+        Run fn and record its result, unless the stage has already completed
+        If valid is passed, a recorded result is only used if valid(result)
+        """
+        result = self.get_stage(stage)
+        if result is not None and (valid is None or valid(result)):
+            logger.info("Skipping completed stage %s", stage)
+            return result
+        result = fn()
+        self.complete_stage(stage, result)
+        return result
@@ -0,0 +1,144 @@
+import functools
+
+
+class Field(object):
+    """
+    Declarative mapping of a value onto an XML path
+    The value is either a constant, or read from the source attribute
+    (treatments) / key (materials) and optionally passed through a formatter
+    """
+
+    def __init__(self, path, source=None, value=None, formatter=None, required=False):
+        self.path = path
+        self.source = source
+        self.value = value
+        self.formatter = formatter
+        # If required, the element is added even if the source has no value
+        self.required = required
+
+    def compile(self, builder, getter):
+        """
+        Compile the field into an emitter function emit(parent, obj)
+        """
+        if self.value is not None:
+            return self._compile_constant(builder)
+
+        SubElement = builder.SubElement
+        head, tail = self.path[0], self.path[1:]
+        source = self.source
+        formatter = self.formatter
+        required = self.required
+
+        def emit(parent, obj):
+            value = getter(obj, source)
+            if not value and not required:
+                return
+            el = SubElement(parent, head)
+            for tag in tail:
+                el = SubElement(el, tag)
+            if formatter:
+                formatter(builder, el, value)
+            elif value:
+                el.text = value
+
+        return emit
+
+    def _compile_constant(self, builder):
+        # Building the elements directly is faster than copying a prebuilt
+        # template
+        SubElement = builder.SubElement
+        head, tail = self.path[0], self.path[1:]
+        value = self.value
+
+        def emit(parent, obj):
+            el = SubElement(parent, head)
+            for tag in tail:
+                el = SubElement(el, tag)
+            el.text = value
+
+        return emit
+
+
+@functools.lru_cache(maxsize=4096)
+def split_scientific_name(scientific_name):
+    """
+    Split a scientific name into the genus and the rest of the name
+    Materials of a species share their name, so the parts are cached
+    """
+    return tuple(scientific_name.split(' ', 1))
+
+
+def format_scientific_name(builder, el, name_parts):
+    """
+    Italicize the first part (genus) of the scientific name - name_parts
+    as split by split_scientific_name when the material was added
+    """
+    value_el = builder.SubElement(el, 'value')
+    builder.SubElement(value_el, 'em').text = name_parts[0] or None
+    if len(name_parts) > 1:
+        builder.SubElement(value_el, 'span').text = ' ' + name_parts[1]
+    else:
+        builder.SubElement(value_el, 'span')
+
+
+# Treatment fields - source is the treatment attribute
+treatment_fields = [
+    Field(['classification', 'value'], source='taxon', required=True),
+    Field(['type_of_treatment', 'value'],
+          value='Redescription or species observation'),
+    Field(['rank', 'value'], value='Species'),
+    Field(['species', 'value'], source='species'),
+    Field(['genus', 'value'], source='genus'),
+    Field(['subgenus', 'value'], source='subgenus'),
+    Field(['taxon_authors', 'value'], source='taxon_authors'),
+]
+
+# Material fields - source is the (lower case) material key
+# Any material fields not mapped here are added as <field><value>
+material_fields = [
+    Field(['type_status', 'value'], value='Other material'),
+    Field(['scientificname'], source='scientificname',
+          formatter=format_scientific_name),
+]
+
+
+def _get_attribute(obj, name):
+    return getattr(obj, name, None)
+
+
+def _get_key(obj, name):
+    return obj.get(name)
+
+
+def compile_treatment_emitter(builder, fields=treatment_fields):
+    """
+    Compile treatment fields into a single emitter function
+    """
+    emitters = [field.compile(builder, _get_attribute) for field in fields]
+
+    def emit(parent, treatment):
+        for emitter in emitters:
+            emitter(parent, treatment)
+
+    return emit
+
+
+def compile_material_emitter(builder, fields=material_fields):
+    """
+    Compile material fields into a single emitter function
+    """
+    emitters = [field.compile(builder, _get_key) for field in fields]
+    mapped = set(field.source for field in fields if field.source)
+    SubElement = builder.SubElement
+
+    def emit(parent, material):
+        for emitter in emitters:
+            emitter(parent, material)
+        for fn, value in material.items():
+            if fn in mapped:
+                continue
+            el = SubElement(SubElement(parent, fn), 'value')
+            if value:
+                el.text = value
+
+    return emit
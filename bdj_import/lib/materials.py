@@ -0,0 +1,89 @@
+from collections import OrderedDict
+
+
+# Groups of material fields materials can be aggregated by
+# Field names are lower case, as stored by SpeciesTreatment.add_material
+aggregation_keys = OrderedDict([
+    ('locality', [
+        'waterbody',
+        'stateprovince',
+        'locality',
+        'verbatimlocality',
+        'locationremarks',
+        'decimallatitude',
+        'decimallongitude',
+        'geodeticdatum',
+        'country',
+    ]),
+    ('event', [
+        'eventdate',
+        'eventtime',
+        'fieldnumber',
+        'fieldnotes',
+    ]),
+    ('depth', [
+        'maximumdepthinmeters',
+    ]),
+    ('protocol', [
+        'samplingprotocol',
+    ]),
+])
+
+
+def aggregate_materials(materials, keys):
+    """
+    Collapse materials which share the same values for the key fields
+    into a single material - individual counts are summed and catalogue
+    numbers are listed
+    """
+    # Always group by scientific name, otherwise it would be dropped
+    fields = ['scientificname']
+    for key in keys:
+        try:
+            fields.extend(aggregation_keys[key])
+        except KeyError:
+            raise ValueError('Unknown material aggregation key {}'.format(key))
+
+    groups = OrderedDict()
+    for material in materials:
+        group_key = tuple(material.get(fn) for fn in fields)
+        groups.setdefault(group_key, []).append(material)
+
+    return [_merge_materials(group) for group in groups.values()]
+
+
+def _merge_materials(materials):
+    """
+    Merge a group of materials into one
+    Only fields with the same value in every material are retained
+    """
+    if len(materials) == 1:
+        return materials[0]
+
+    field_names = OrderedDict()
+    for material in materials:
+        field_names.update((fn, None) for fn in material)
+
+    merged = OrderedDict()
+    for fn in field_names:
+        values = [material.get(fn) for material in materials]
+        if fn == 'individualcount':
+            count = _sum_counts(values)
+            if count:
+                merged[fn] = str(count)
+        elif fn == 'catalognumber':
+            merged[fn] = ', '.join(OrderedDict.fromkeys(v for v in values if v))
+        elif all(v == values[0] for v in values):
+            merged[fn] = values[0]
+
+    return merged
+
+
+def _sum_counts(values):
+    count = 0
+    for value in values:
+        try:
+            count += int(value)
+        except (TypeError, ValueError):
+            pass
+    return count
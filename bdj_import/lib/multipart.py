@@ -0,0 +1,96 @@
+import os
+import time
+import uuid
+import logging
+
+
+logger = logging.getLogger()
+
+
+class MultipartFile(object):
+    """
+    File like multipart/form-data body, which streams a file as a form field
+
+    The body is read in chunks as it is sent, so memory use is constant
+    regardless of file size. Upload progress and throughput are logged.
+    """
+
+    def __init__(self, fields, name, path, progress_step=0.1):
+        self.boundary = uuid.uuid4().hex
+        self.path = path
+        preamble = b''.join(
+            self._part_header(field_name) + str(value).encode('utf-8') + b'\r\n'
+            for field_name, value in fields.items()
+        ) + self._part_header(name)
+        epilogue = '\r\n--{}--\r\n'.format(self.boundary).encode('ascii')
+        self._size = len(preamble) + os.path.getsize(path) + len(epilogue)
+        self._file = open(path, 'rb')
+        # Body is read in turn from the preamble, the file & the epilogue
+        self._parts = [preamble, self._file, epilogue]
+        self._sent = 0
+        self._start = None
+        # Log progress every progress_step fraction of the body
+        self._progress_step = max(int(self._size * progress_step), 1)
+        self._next_progress = self._progress_step
+
+    def _part_header(self, field_name):
+        return '--{}\r\nContent-Disposition: form-data; name="{}"\r\n\r\n'.format(
+            self.boundary, field_name).encode('utf-8')
+
+    @property
+    def content_type(self):
+        return 'multipart/form-data; boundary={}'.format(self.boundary)
+
+    def __len__(self):
+        return self._size
+
+    def read(self, size=-1):
+        if self._start is None:
+            self._start = time.time()
+        if size is None or size < 0:
+            size = self._size
+        chunks = []
+        while size > 0 and self._parts:
+            part = self._parts[0]
+            if isinstance(part, bytes):
+                chunk, self._parts[0] = part[:size], part[size:]
+                if not self._parts[0]:
+                    self._parts.pop(0)
+            else:
+                chunk = part.read(size)
+                if len(chunk) < size:
+                    self._parts.pop(0)
+            chunks.append(chunk)
+            size -= len(chunk)
+        data = b''.join(chunks)
+        self._progress(len(data))
+        return data
+
+    def _progress(self, sent):
+        if not sent:
+            return
+        self._sent += sent
+        if self._sent < self._next_progress and self._sent < self._size:
+            return
+        self._next_progress = self._sent + self._progress_step
+        logger.info("Uploaded %s of %s bytes (%.0f%%), %.1f KB/s",
+                    self._sent, self._size, 100.0 * self._sent / self._size,
+                    self.throughput / 1024)
+
+    @property
+    def throughput(self):
+        """
+        Bytes per second sent so far
+        """
+        if not self._start:
+            return 0.0
+        return self._sent / max(time.time() - self._start, 1e-6)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
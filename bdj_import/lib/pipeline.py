@@ -0,0 +1,254 @@
+import time
+import logging
+import threading
+from queue import Queue
+from concurrent.futures import ProcessPoolExecutor
+
+
+logger = logging.getLogger()
+
+
+# Marks the end of a stage's input
+_DONE = object()
+
+
+class Stage(object):
+    """
+    A pipeline stage - applies fn to every item passing through
+
+    I/O bound stages should use several worker threads; CPU bound stages
+    can set processes=True to run fn in a process pool (fn and the items
+    must then be picklable). Ordered stages receive items in input order
+    and run with a single worker. An existing thread or process pool can be
+    passed in as the executor, so several pipelines share one pool - the
+    stage then submits up to workers items at a time to the pool, rather
+    than running its own worker threads.
+    """
+
+    def __init__(self, name, fn, workers=1, processes=False, ordered=False,
+                 executor=None):
+        self.name = name
+        self.fn = fn
+        self.workers = 1 if ordered else workers
+        self.processes = processes
+        self.executor = executor
+        self.ordered = ordered
+        self.count = 0
+        # Time spent processing items
+        self.busy = 0.0
+        # Time spent waiting for input (starved)
+        self.starved = 0.0
+        # Time spent blocked on a full output queue (backpressure)
+        self.blocked = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def throughput(self):
+        """
+        Items per second of wall clock time spent processing
+        """
+        if not self.busy:
+            return 0.0
+        return self.count * self.workers / self.busy
+
+    def report(self):
+        logger.info(
+            "Stage %s: %s items, %.1f items/s, busy %.2fs, starved %.2fs, blocked %.2fs",
+            self.name, self.count, self.throughput, self.busy, self.starved, self.blocked
+        )
+
+
+class Pipeline(object):
+    """
+    Run items through a series of stages connected by bounded queues
+    Results are yielded in input order
+    """
+
+    def __init__(self, stages, maxsize=4):
+        self.stages = stages
+        self.maxsize = maxsize
+        self.elapsed = 0.0
+        self._error = None
+
+    def run(self, items):
+        queues = [Queue(self.maxsize) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(
+            target=self._feed, args=(items, queues[0]), daemon=True)]
+
+        executors = []
+        for stage, in_queue, out_queue in zip(self.stages, queues, queues[1:]):
+            executor = stage.executor
+            if not executor and stage.processes:
+                executor = ProcessPoolExecutor(stage.workers)
+                executors.append(executor)
+            if executor:
+                # One thread submits items to the pool, another collects
+                # the results in submission order
+                futures = Queue()
+                slots = threading.Semaphore(stage.workers)
+                threads.append(threading.Thread(
+                    target=self._submit,
+                    args=(stage, in_queue, futures, executor, slots),
+                    daemon=True
+                ))
+                threads.append(threading.Thread(
+                    target=self._collect,
+                    args=(stage, futures, out_queue, slots),
+                    daemon=True
+                ))
+                continue
+            remaining = [stage.workers]
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=(stage, in_queue, out_queue, remaining),
+                    daemon=True
+                ))
+
+        start = time.time()
+        for thread in threads:
+            thread.start()
+
+        try:
+            for seq, result in self._reorder(queues[-1]):
+                yield result
+        except BaseException as e:
+            # The consumer has stopped - stop the stages and drain the output
+            # so no thread is left blocked on a full queue
+            self._error = self._error or e
+            for item in self._unordered(queues[-1]):
+                pass
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+            for executor in executors:
+                executor.shutdown()
+            self.elapsed = time.time() - start
+
+        if self._error:
+            raise self._error
+
+    def _feed(self, items, queue):
+        try:
+            for seq, item in enumerate(items):
+                if self._error:
+                    break
+                queue.put((seq, item))
+        except Exception as e:
+            self._error = e
+        queue.put(_DONE)
+
+    def _work(self, stage, in_queue, out_queue, remaining):
+        for seq, item in self._get(stage, in_queue):
+            if self._error:
+                # Drain the input, so upstream stages are not blocked
+                continue
+            start = time.time()
+            try:
+                result = stage.fn(item)
+            except Exception as e:
+                self._error = e
+                continue
+            end = time.time()
+            out_queue.put((seq, result))
+            with stage._lock:
+                stage.count += 1
+                stage.busy += end - start
+                stage.blocked += time.time() - end
+
+        # The last worker to finish passes the end marker downstream
+        with stage._lock:
+            remaining[0] -= 1
+            last = not remaining[0]
+        if last:
+            out_queue.put(_DONE)
+        else:
+            # Let the other workers see the end of the input
+            in_queue.put(_DONE)
+
+    def _submit(self, stage, in_queue, futures, executor, slots):
+        """
+        Submit a stage's items to its executor, with at most stage.workers
+        items in flight
+        """
+        for seq, item in self._get(stage, in_queue):
+            if self._error:
+                continue
+            slots.acquire()
+            try:
+                future = executor.submit(stage.fn, item)
+            except Exception as e:
+                self._error = e
+                slots.release()
+                continue
+            futures.put((seq, future, time.time()))
+        futures.put(_DONE)
+
+    def _collect(self, stage, futures, out_queue, slots):
+        """
+        Pass the results of a stage's submitted items downstream
+        """
+        for seq, future, start in self._unordered(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                self._error = e
+                continue
+            finally:
+                slots.release()
+            end = time.time()
+            out_queue.put((seq, result))
+            with stage._lock:
+                stage.count += 1
+                stage.busy += end - start
+                stage.blocked += time.time() - end
+        out_queue.put(_DONE)
+
+    def _get(self, stage, queue):
+        """
+        Get items from the stage input queue until the end marker
+        """
+        items = self._reorder(queue) if stage.ordered else self._unordered(queue)
+        while True:
+            start = time.time()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            finally:
+                stage.starved += time.time() - start
+            yield item
+
+    @staticmethod
+    def _unordered(queue):
+        while True:
+            item = queue.get()
+            if item is _DONE:
+                return
+            yield item
+
+    @staticmethod
+    def _reorder(queue):
+        """
+        Buffer out of order items, yielding them in input sequence
+        """
+        buffer = {}
+        next_seq = 0
+        while True:
+            item = queue.get()
+            if item is _DONE:
+                break
+            seq, result = item
+            buffer[seq] = result
+            while next_seq in buffer:
+                yield next_seq, buffer.pop(next_seq)
+                next_seq += 1
+        # Failed items leave gaps - yield anything left over in order
+        for seq in sorted(buffer):
+            yield seq, buffer[seq]
+
+    def report(self):
+        for stage in self.stages:
+            stage.report()
+        logger.info("Pipeline completed in %.2fs", self.elapsed)
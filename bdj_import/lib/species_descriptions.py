@@ -1,8 +1,10 @@
+import os
 import re
 import logging
+from concurrent.futures import ProcessPoolExecutor
 
 from bdj_import.lib.file import File
-from bdj_import.lib.description import Description
+from bdj_import.lib.description import Description, parse_body
 from bdj_import.lib.helpers import normalize
 
 
@@ -37,13 +39,35 @@ class SpeciesDescriptions(object):
         'Sternaspis sp. 1': 'Sternaspidae Carus, 1863'
     }
 
-    def __init__(self):
+    def __init__(self, file_name='species-description-export.csv', workers=None,
+                 executor=None):
         self.descriptions = []
-        self._parse_data()
+        # Number of processes parsing description bodies - defaults to
+        # the number of cores, 1 parses in process
+        self.workers = workers or os.cpu_count() or 1
+        # Optional existing process pool to parse the bodies in, so several
+        # exports can share one pool
+        self.executor = executor
+        self._parse_data(file_name)
+
+    def _parse_bodies(self, bodies):
+        """
+        Parse the description body html, in parallel across a process pool
+        """
+        if self.workers == 1 or len(bodies) < 2:
+            return [parse_body(body) for body in bodies]
+        chunksize = max(1, len(bodies) // (self.workers * 4))
+        if self.executor:
+            return list(self.executor.map(parse_body, bodies, chunksize=chunksize))
+        with ProcessPoolExecutor(self.workers) as executor:
+            return list(executor.map(parse_body, bodies, chunksize=chunksize))
+
+    def _parse_data(self, file_name):
 
-    def _parse_data(self):
+        rows = list(File(file_name))
+        parsed_bodies = self._parse_bodies([row['Body'] for row in rows])
 
-        for row in File('species-description-export.csv'):
+        for row, parsed in zip(rows, parsed_bodies):
 
             # If this is of rank family, index by family name
             # Otherwise index by title /classification
@@ -70,7 +94,8 @@ class SpeciesDescriptions(object):
                 tid=row['Term ID'],
                 index=set([self._normalize_index(i) for i in idx]),
                 scientific_name=row['Classification'],
-                rank=rank
+                rank=rank,
+                parsed=parsed
             )
             self.descriptions.append(desc)
 
@@ -1,12 +1,16 @@
 import re
-from fuzzywuzzy import fuzz
 
 from bdj_import.lib.treatment import Treatment
 from bdj_import.lib.helpers import strip_parenthesis, normalize
+from bdj_import.lib.distribution import Occurrences
+from bdj_import.lib.mapping import split_scientific_name
 
 
 class SpeciesTreatment(Treatment):
 
+    __slots__ = ['fields', 'occurrences', 'species', 'genus', 'subgenus',
+                 'taxon_authors', 'notes', 'diagnosis']
+
     # Fields to include in material detail
     material_fields = [
         'family',
@@ -37,17 +41,35 @@ class SpeciesTreatment(Treatment):
     ]
 
     def __init__(self, **kwargs):
-        self.fields = self._parse_species_description(
-            kwargs.get('description'))
+        # Body text split into voucher, diagnosis & remarks
+        description = kwargs.get('description')
+        self.fields = description.fields if description else {}
+        # Coordinates, depths & dates of materials, for distribution summaries
+        self.occurrences = Occurrences()
         super(SpeciesTreatment, self).__init__(**kwargs)
 
     def add_material(self, data):
-        self.materials.append({
+        material = {
             k.lower(): normalize(v) for k, v in data.items() if k in self.material_fields and v
-        })
-
-    @property
-    def species(self):
+        }
+        if 'scientificname' in material:
+            # Split once, rather than every time the material is built
+            material['scientificname'] = split_scientific_name(material['scientificname'])
+        self.materials.append(material)
+        self.occurrences.add(data)
+
+    def finalize(self):
+        """
+        Compute the taxonomic fields and notes once, rather than on access
+        """
+        self.species = self._get_species()
+        self.genus = self._get_genus()
+        self.subgenus = self._get_subgenus()
+        self.taxon_authors = self._get_taxon_authors()
+        self.notes = self.fields.get('remarks', ())
+        self.diagnosis = self.fields.get('diagnosis')
+
+    def _get_species(self):
         # We do not want to include the specific_epithet if it's sp.
         # as then it will be italicized - it will be added to the authors
         species = self.taxonomy.get('specific_epithet', None)
@@ -56,8 +78,7 @@ class SpeciesTreatment(Treatment):
                 species = 'cf. {}'.format(species)
             return species
 
-    @property
-    def genus(self):
+    def _get_genus(self):
         genus = self.taxonomy.get('genus', None)
         # We have no genus - so if the species name is just sp 1. it will
         # look incorrect - so try and get the genus from the scientific name
@@ -67,16 +88,14 @@ class SpeciesTreatment(Treatment):
                 genus = self.taxon.split(specific_epithet)[0]
         return genus
 
-    @property
-    def subgenus(self):
+    def _get_subgenus(self):
         subgenus = self.taxonomy.get('subgenus', None)
         if subgenus:
             # Replace any parenthesis - these are added in the BDJ
             subgenus = strip_parenthesis(subgenus)
         return subgenus
 
-    @property
-    def taxon_authors(self):
+    def _get_taxon_authors(self):
 
         # Some taxonomic concepts include sub-specific(?) epithets
         # E.G. Aphelochaeta sp. 5fA, Aphelochaeta sp. 5fb
@@ -103,47 +122,5 @@ class SpeciesTreatment(Treatment):
 
         return taxon_authors
 
-    @property
-    def notes(self):
-        return self.fields.get('remarks', [])
-
-    @property
-    def diagnosis(self):
-        return self.fields.get('diagnosis')
-
     def _is_abbreviated_specific_name(self):
         return self.taxonomy.get('specific_epithet') == 'sp.'
-
-    def _parse_species_description(self, description):
-        """
-        Parse body text, splitting into voucher diagnosis & remarks
-        """
-        fields = {}
-        field_names = ['voucher', 'diagnosis', 'remarks']
-        # The body contains the taxonomy in headers at the top
-        # Which needs to be stripped out, otherwise will duplicate data in
-        # publication proper - so match the strong content
-        # If we match on classification, we end up stripping out content from later in the
-        # process e.g. tables with taxonomy in the description
-        # instead we wait until the first paragraph matching Voucher, Diagnosis or Remarks
-        # and discard all previous paragraphs
-
-        # Loop through all of the strong tags, and see if it's voucher, diagnosis etc.,
-        # If it is, then set the current field - used to key
-        current_field = None
-        if description:
-            for p in description.paragraphs:
-                for strong in p.find_all("strong"):
-                    for field_name in field_names:
-                        strong_text = strong.getText().lower()
-                        fuzz_ratio = fuzz.partial_ratio(
-                            field_name, strong_text)
-                        if fuzz_ratio > 99:
-                            current_field = field_name
-                            # Remove the strong label text
-                            strong.extract()
-
-                if current_field:
-                    fields.setdefault(current_field, []).append(p)
-
-        return fields
@@ -0,0 +1,77 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+
+from bdj_import.lib.helpers import write_atomic
+
+
+logger = logging.getLogger()
+
+
+class HashingWriter(object):
+    """
+    Wrap a binary file object, hashing the content as it is written
+    So the document digest is available without a second pass
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self._hash = hashlib.sha256()
+
+    def write(self, data):
+        self._hash.update(data)
+        return self.f.write(data)
+
+    def tell(self):
+        return self.f.tell()
+
+    @property
+    def digest(self):
+        return self._hash.hexdigest()
+
+
+class ResponseStore(object):
+    """
+    Local store of API responses for successfully validated and imported
+    documents, keyed by the content hash of the document, and the
+    endpoint, username and action of the request
+    Repeat requests for identical content can return the stored response
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self._data = json.load(f)
+        except (IOError, ValueError):
+            self._data = {}
+
+    @staticmethod
+    def digest(xml):
+        """
+        Content hash of an XML document (str or bytes)
+        """
+        if not isinstance(xml, bytes):
+            xml = xml.encode('utf-8')
+        return hashlib.sha256(xml).hexdigest()
+
+    @staticmethod
+    def _key(endpoint, username, action):
+        # Responses are per account - e.g. an import under one account is
+        # not an import under another
+        return '{} {} {}'.format(endpoint, username, action)
+
+    def get(self, digest, endpoint, username, action):
+        return self._data.get(digest, {}).get(self._key(endpoint, username, action))
+
+    def add(self, digest, endpoint, username, action, response):
+        with self._lock:
+            self._data.setdefault(digest, {})[
+                self._key(endpoint, username, action)] = response
+            dir_name = os.path.dirname(os.path.abspath(self.path))
+            if not os.path.isdir(dir_name):
+                os.makedirs(dir_name)
+            write_atomic(self.path, json.dumps(self._data).encode('utf-8'))
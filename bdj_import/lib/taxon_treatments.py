@@ -4,7 +4,6 @@ import csv
 from bdj_import.lib.helpers import normalize
 from bs4 import BeautifulSoup
 from fuzzywuzzy import fuzz
-from sortedcontainers import SortedDict
 import logging
 
 from bdj_import.lib.file import File
@@ -26,84 +25,238 @@ class TaxonTreatments():
         'Ilyphagus sp.'
     ]
 
-    def __init__(self):
-        self._data = SortedDict()
-        self._parse_data()
+    def __init__(self, dwca_file='falklands-utf8.dwca.csv',
+                 descriptions_file='species-description-export.csv',
+                 images_file='image-export.csv', cache=None, parse_workers=None,
+                 executor=None, lazy=False, families=None):
+        # Family => family treatment, or if lazy the offsets of its rows
+        self._data = {}
+        self.dwca_file = dwca_file
+        self.descriptions_file = descriptions_file
+        self.images_file = images_file
+        # Optional dict of parsed descriptions & figures, keyed by file
+        # Allows several datasets to share the source exports
+        self.cache = cache
+        # Number of processes parsing species descriptions
+        self.parse_workers = parse_workers
+        # Optional existing process pool parsing species descriptions
+        self.executor = executor
+        # If lazy, the DwC-A rows are just indexed by family, and each
+        # family's treatments are built when it is accessed - so only the
+        # families in use are held in memory
+        self.lazy = lazy
+        self._species_descriptions = None
+        self._figures = None
+        self._dwca = None
+        if families is None:
+            self._parse_data()
+        else:
+            # Already parsed (and finalized) family treatments - the
+            # source files are not read
+            self.lazy = False
+            self._data = dict(sorted((f.taxon, f) for f in families))
 
     def __iter__(self):
         return iter(self._data)
 
+    def __getitem__(self, family):
+        family_treatment = self._get(family)
+        if family_treatment is None:
+            raise KeyError(family)
+        return family_treatment
+
+    def __delitem__(self, family):
+        del self._data[family]
+
+    def __len__(self):
+        return len(self._data)
+
     def keys(self):
         return self._data.keys()
 
     def items(self):
+        if self.lazy:
+            return ((key, self._get(key)) for key in list(self._data.keys()))
         return self._data.items()
 
     def values(self):
+        if self.lazy:
+            return (self._get(key) for key in list(self._data.keys()))
         return self._data.values()
 
+    def iter_families(self, family=None):
+        """
+        Yield family treatments, optionally just the matching family
+        """
+        # Iterate over a copy of the keys, so families can be released
+        # while iterating
+        for key in list(self._data.keys()):
+
+            if family:
+                if key.lower() != family.lower():
+                    continue
+
+            family_treatment = self._get(key)
+
+            if family_treatment is None:
+                continue
+
+            yield family_treatment
+
+    def iter_treatments(self, family=None, taxon=None, limit=None, release=False):
+        """
+        Yield treatments one at a time - each family treatment followed by
+        its species treatments
+        If release is set, families are removed as they are yielded, so
+        they can be garbage collected once the caller is done with them
+        """
+        count = 0
+        for family_treatment in self.iter_families(family):
+            if release:
+                del self._data[family_treatment.taxon]
+            yield family_treatment
+            for species_treatment in family_treatment.list_species(taxon):
+                if limit and count >= limit:
+                    return
+                yield species_treatment
+                count += 1
+
+    def _get(self, family):
+        value = self._data.get(family)
+        if self.lazy and value is not None:
+            return self._build_family(family, value)
+        return value
+
     def _parse_data(self):
-        species_descriptions = SpeciesDescriptions()
-        figures = Figures()
-        dwca = File('falklands-utf8.dwca.csv')
+        self._species_descriptions = self._load(
+            SpeciesDescriptions, self.descriptions_file,
+            workers=self.parse_workers, executor=self.executor)
+        self._figures = self._load(Figures, self.images_file)
+        self._dwca = File(self.dwca_file)
 
-        for row in dwca:
+        if self.lazy:
+            # Grouping pass - index the rows of each family
+            for offset, row in self._dwca.iter_offsets():
+                family = self._get_row_family(row)
+                if family:
+                    self._data.setdefault(family, []).append(offset)
+        else:
+            for row in self._dwca:
+                family = self._get_row_family(row)
+                if family:
+                    # Ensure the family exists
+                    try:
+                        family_treatment = self._data[family]
+                    except KeyError:
+                        family_treatment = self._data[family] = self._new_family(family)
+                    self._add_row(family_treatment, row)
+            for family_treatment in self._data.values():
+                family_treatment.finalize()
 
-            # We are only interested in voucher specimens
-            type_status = row.get('typeStatus', None)
+        # Sort once all rows have been read, rather than on insert
+        self._data = dict(sorted(self._data.items()))
 
-            if type_status and type_status.lower() == 'voucher':
+    def _get_row_family(self, row):
+        """
+        Return the family of a DwC-A row, or None if the row is not included
+        """
+        # We are only interested in voucher specimens
+        type_status = row.get('typeStatus', None)
 
-                family = normalize(row.get('family'))
+        if type_status and type_status.lower() == 'voucher':
 
-                normalized_taxon = normalize(row['taxonConceptID'])
+            # If this is a taxon to be excluded continue to next
+            if normalize(row['taxonConceptID']) in self.excluded_taxa:
+                return None
 
-                # If this is a taxon to be excluded continue to next
-                if normalized_taxon in self.excluded_taxa:
-                    continue
+            return normalize(row.get('family'))
+
+        return None
+
+    def _new_family(self, family):
+        return FamilyTreatment(
+            taxon=family,
+            description=self._species_descriptions.get_family(family)
+        )
+
+    def _build_family(self, family, offsets):
+        """
+        Build a family treatment from its indexed rows
+        """
+        family_treatment = self._new_family(family)
+        for row in self._dwca.read_rows(offsets):
+            self._add_row(family_treatment, row)
+        family_treatment.finalize()
+        return family_treatment
+
+    def _add_row(self, family_treatment, row):
+        """
+        Add a DwC-A row to its species treatment, creating it if need be
+        """
+        normalized_taxon = normalize(row['taxonConceptID'])
+
+        species = family_treatment.get_species(normalized_taxon)
+
+        if not species:
+
+            treatment_description = self._species_descriptions[
+                normalized_taxon]
+
+            if treatment_description:
+                treatment_figures = self._figures[treatment_description.tid]
+            else:
+                treatment_figures = None
+                logger.warning('No species description for %s',
+                               normalized_taxon)
+
+            treatment_taxonomy_fields = [
+                ('genus', 'genus'),
+                ('subgenus', 'subgenus'),
+                ('family', 'family'),
+                ('taxon_authors', 'scientificNameAuthorship'),
+                ('specific_epithet', 'specificEpithet'),
+            ]
+
+            treatment_taxonomy = {fld: normalize(
+                row.get(col)) for fld, col in treatment_taxonomy_fields}
+
+            species = SpeciesTreatment(
+                taxon=normalized_taxon,
+                description=treatment_description,
+                taxonomy=treatment_taxonomy,
+                figures=treatment_figures,
+            )
+
+            family_treatment.add_species(species)
+
+        # Add material
+        species.add_material(row)
+
+    def _load(self, cls, file_name, **kwargs):
+        """
+        Load source file, using the cache if we have one
+        """
+        if self.cache is None:
+            return cls(file_name, **kwargs)
+        key = (cls.__name__, file_name)
+        try:
+            return self.cache[key]
+        except KeyError:
+            obj = self.cache[key] = cls(file_name, **kwargs)
+            return obj
+
+
+def iter_treatments(family=None, taxon=None, limit=None, **kwargs):
+    """
+    Yield fully populated treatments one at a time - see
+    TaxonTreatments.iter_treatments
+    Keyword arguments are passed to TaxonTreatments (source file names)
 
-                # Ensure the family exists
-                try:
-                    self._data[family]
-                except KeyError:
-                    self._data[family] = FamilyTreatment(
-                        taxon=family,
-                        description=species_descriptions.get_family(family)
-                    )
-
-                species = self._data[family].get_species(normalized_taxon)
-
-                if not species:
-
-                    treatment_description = species_descriptions[
-                        normalized_taxon]
-
-                    if treatment_description:
-                        treatment_figures = figures[treatment_description.tid]
-                    else:
-                        treatment_figures = None
-                        logger.warning('No species description for %s',
-                                       normalized_taxon)
-
-                    treatment_taxonomy_fields = [
-                        ('genus', 'genus'),
-                        ('subgenus', 'subgenus'),
-                        ('family', 'family'),
-                        ('taxon_authors', 'scientificNameAuthorship'),
-                        ('specific_epithet', 'specificEpithet'),
-                    ]
-
-                    treatment_taxonomy = {fld: normalize(
-                        row.get(col)) for fld, col in treatment_taxonomy_fields}
-
-                    species = SpeciesTreatment(
-                        taxon=normalized_taxon,
-                        description=treatment_description,
-                        taxonomy=treatment_taxonomy,
-                        figures=treatment_figures,
-                    )
-
-                    self._data[family].add_species(species)
-
-                # Add material
-                species.add_material(row)
+    The source files are read when iteration starts. Descriptions and
+    figures are loaded in full (they are looked up by taxon), and the
+    DwC-A is indexed by family in one pass - then each family's treatments
+    are built as they are reached, so only one family is held in memory
+    """
+    treatments = TaxonTreatments(lazy=True, **kwargs)
+    for treatment in treatments.iter_treatments(family, taxon, limit, release=True):
+        yield treatment
@@ -3,6 +3,9 @@ import abc
 
 class Treatment(object):
 
+    # Treatments are numerous, so use slots rather than a dict per object
+    __slots__ = ['taxon', 'taxonomy', 'description', 'figures', 'materials']
+
     def __init__(self, taxon, description, taxonomy=[], figures=[]):
 
         self.taxon = taxon
@@ -14,6 +17,13 @@ class Treatment(object):
     def __repr__(self):
         return 'Treatment ({})'.format(self.taxon)
 
+    def finalize(self):
+        """
+        Compute derived fields - called once all the source data has been
+        added to the treatment
+        """
+        pass
+
     @abc.abstractproperty
     def diagnosis(self):
         return None
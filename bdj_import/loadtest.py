@@ -0,0 +1,137 @@
+"""
+Load test harness - drives full imports against the local stub server
+and records latency and throughput
+"""
+import os
+import time
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import click_log
+
+from bdj_import.api import API
+from bdj_import.doc import Doc
+from bdj_import.stub import StubServer
+from bdj_import.lib import helpers
+from bdj_import.lib.pipeline import Pipeline, Stage
+
+
+logger = logging.getLogger()
+
+
+class LoadTest(object):
+    """
+    Run full imports (parse, build, figure checks, upload) against a stub
+    """
+
+    def __init__(self, stub, action='validate_document', limit=None, family=None,
+                 skip_images=False, workers=8):
+        self.stub = stub
+        self.action = action
+        self.limit = limit
+        self.family = family
+        self.skip_images = skip_images
+        self.workers = workers
+        self.api = API(endpoint=stub.endpoint, username='stub', api_key='stub')
+        self.results = []
+        self.elapsed = 0.0
+
+    def run(self, iterations=1, concurrency=1):
+        # Route the figure checks (plain http image URLs) through the stub
+        proxies = dict(helpers.session.proxies)
+        helpers.session.proxies['http'] = self.stub.url
+        start = time.time()
+        try:
+            with ThreadPoolExecutor(concurrency) as executor:
+                self.results = list(executor.map(self._import, range(iterations)))
+        finally:
+            helpers.session.proxies = proxies
+        self.elapsed = time.time() - start
+        return self.results
+
+    def _import(self, iteration):
+        """
+        Run one full import, returning a dict of timings
+        """
+        # Clear the figure cache, so each import checks its figures
+        helpers._file_exists_cache.clear()
+        result = {'iteration': iteration, 'error': None, 'size': 0}
+        start = time.time()
+        fd, path = tempfile.mkstemp(suffix='.xml')
+        os.close(fd)
+        try:
+            doc = Doc('Load test {}'.format(iteration), self.limit, None,
+                      self.family, self.skip_images, bounded=True)
+            parsed = time.time()
+            engine = Pipeline([
+                Stage('figures', doc.check_figures, workers=self.workers),
+                Stage('build', doc.build_family_fragment, ordered=True),
+            ])
+            with open(path, 'wb') as f:
+                doc.write(f, engine.run(doc.iter_families()))
+                result['size'] = f.tell()
+            built = time.time()
+            try:
+                self.api.request_file(self.action, path)
+            except Exception as e:
+                result['error'] = str(e)
+            end = time.time()
+        finally:
+            os.remove(path)
+        result.update(parse=parsed - start, build=built - parsed,
+                      api=end - built, total=end - start)
+        return result
+
+    @staticmethod
+    def _percentile(values, pct):
+        values = sorted(values)
+        if not values:
+            return 0.0
+        return values[min(int(len(values) * pct / 100.0), len(values) - 1)]
+
+    def report(self):
+        errors = [r for r in self.results if r['error']]
+        size = sum(r['size'] for r in self.results)
+        for phase in ['parse', 'build', 'api', 'total']:
+            values = [r[phase] for r in self.results]
+            logger.info("%s latency: p50 %.3fs, p90 %.3fs, p99 %.3fs, max %.3fs",
+                        phase, self._percentile(values, 50), self._percentile(values, 90),
+                        self._percentile(values, 99), max(values or [0]))
+        logger.info("%s imports (%s errors) in %.2fs: %.2f imports/s, %.1f KB/s uploaded",
+                    len(self.results), len(errors), self.elapsed,
+                    len(self.results) / max(self.elapsed, 1e-6),
+                    size / 1024.0 / max(self.elapsed, 1e-6))
+        logger.info("Stub requests: %s", self.stub.requests)
+
+
+@click.command()
+@click.option('--iterations', '-n', default=5, type=int, help='Number of imports.')
+@click.option('--concurrency', '-c', default=1, type=int, help='Number of concurrent imports.')
+@click.option('--action', default='validate_document', type=click.Choice(['validate_document', 'import_document']))
+@click.option('--limit', '-l', default=None, type=int, help='Number of classifications.')
+@click.option('--family', '-f', default=None, help='Import specific family and child taxa.')
+@click.option('--skip-images', '-i', is_flag=True, help='Do not check images.')
+@click.option('--latency', default=0.0, type=float, help='Stub API latency (seconds).')
+@click.option('--image-latency', default=0.0, type=float, help='Stub image HEAD latency (seconds).')
+@click.option('--error-rate', default=0.0, type=float, help='Fraction of stub API requests returning an error.')
+@click.option('--missing-image-rate', default=0.0, type=float, help='Fraction of stub images returning 404.')
+@click.option('--max-payload', default=None, type=int, help='Stub maximum request size (bytes).')
+@click_log.simple_verbosity_option(logger)
+def main(iterations, concurrency, action, limit, family, skip_images, latency,
+         image_latency, error_rate, missing_image_rate, max_payload):
+    stub = StubServer(latency=latency, image_latency=image_latency,
+                      error_rate=error_rate, missing_image_rate=missing_image_rate,
+                      max_payload=max_payload).start()
+    try:
+        load_test = LoadTest(stub, action, limit, family, skip_images)
+        load_test.run(iterations, concurrency)
+        load_test.report()
+    finally:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    click_log.basic_config(logger)
+    main()
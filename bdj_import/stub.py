@@ -0,0 +1,199 @@
+"""
+Local stub of the ARPHA API and image host, for offline testing
+
+Implements the authenticate, validate_document and import_document
+actions, and HEAD requests for images. Latency, error rates and the
+maximum payload size are configurable.
+
+The stub also accepts proxied requests (absolute URLs), so figure checks
+can be pointed at it by using it as the HTTP proxy of the shared session.
+"""
+import time
+import random
+import logging
+import threading
+import email.policy
+from email.parser import BytesParser
+from urllib.parse import urlparse, parse_qs
+from xml.etree import ElementTree
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+import click
+import click_log
+
+
+logger = logging.getLogger()
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, image_latency=0.0,
+                 error_rate=0.0, missing_image_rate=0.0, max_payload=None,
+                 username=None, api_key=None):
+        HTTPServer.__init__(self, (host, port), StubHandler)
+        # Seconds to wait before responding to API / image requests
+        self.latency = latency
+        self.image_latency = image_latency
+        # Fraction of API requests failing with an API error
+        self.error_rate = error_rate
+        # Fraction of image HEAD requests returning 404
+        self.missing_image_rate = missing_image_rate
+        # Maximum request body size (bytes) - larger requests get a 413
+        self.max_payload = max_payload
+        # If set, only these credentials will authenticate
+        self.username = username
+        self.api_key = api_key
+        self.requests = {}
+        self.bytes_received = 0
+        self.document_count = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address)
+
+    @property
+    def endpoint(self):
+        return self.url + '/api.php'
+
+    def start(self):
+        """
+        Serve in a background thread
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def record(self, request, size=0):
+        with self._lock:
+            self.requests[request] = self.requests.get(request, 0) + 1
+            self.bytes_received += size
+
+    def respond(self, params):
+        """
+        Return API result dict for request params
+        """
+        action = params.get('action')
+        if self.username and (params.get('username') != self.username or
+                              params.get('api_key') != self.api_key):
+            return self._error('Authentication failed')
+        if random.random() < self.error_rate:
+            return self._error('Stub error')
+        if action == 'authenticate':
+            return self._result()
+        if action in ('validate_document', 'import_document'):
+            try:
+                ElementTree.fromstring(params.get('xml') or '')
+            except ElementTree.ParseError as e:
+                return self._error('Invalid XML: {}'.format(e))
+            if action == 'validate_document':
+                return self._result()
+            with self._lock:
+                self.document_count += 1
+                document_id = self.document_count
+            return self._result(
+                document_id=document_id,
+                doc_edit_url='{}/document/{}'.format(self.url, document_id)
+            )
+        return self._error('Unknown action {}'.format(action))
+
+    @staticmethod
+    def _result(**fields):
+        result = {'returnCode': '0'}
+        result.update(fields)
+        return result
+
+    @staticmethod
+    def _error(msg):
+        return {'returnCode': '1', 'errorMsg': msg}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        # Image host
+        server = self.server
+        server.record('image')
+        time.sleep(server.image_latency)
+        status = 404 if random.random() < server.missing_image_rate else 200
+        self.send_response(status)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        server = self.server
+        if urlparse(self.path).path != '/api.php':
+            return self._send(404, b'')
+
+        size = int(self.headers.get('Content-Length', 0))
+        if server.max_payload and size > server.max_payload:
+            server.record('rejected', size)
+            # Discard the body, so the client sees the response
+            while size > 0:
+                size -= len(self.rfile.read(min(size, 65536)))
+            return self._send(413, b'Payload too large')
+
+        body = self.rfile.read(size)
+        params = self._parse_params(body)
+        server.record(params.get('action'), size)
+        time.sleep(server.latency)
+
+        result = server.respond(params)
+        el = ElementTree.Element('result')
+        for key, value in result.items():
+            ElementTree.SubElement(el, key).text = str(value)
+        self._send(200, ElementTree.tostring(el), 'text/xml')
+
+    def _parse_params(self, body):
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('multipart/form-data'):
+            msg = BytesParser(policy=email.policy.HTTP).parsebytes(
+                'Content-Type: {}\r\n\r\n'.format(content_type).encode('ascii') + body)
+            return {
+                part.get_param('name', header='content-disposition'):
+                    part.get_payload(decode=True).decode('utf-8')
+                for part in msg.iter_parts()
+            }
+        return {k: v[0] for k, v in parse_qs(body.decode('utf-8')).items()}
+
+    def _send(self, status, body, content_type='text/plain'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("Stub: " + format, *args)
+
+
+@click.command()
+@click.option('--port', default=8000, type=int)
+@click.option('--latency', default=0.0, type=float, help='API response latency (seconds).')
+@click.option('--image-latency', default=0.0, type=float, help='Image HEAD latency (seconds).')
+@click.option('--error-rate', default=0.0, type=float, help='Fraction of API requests returning an error.')
+@click.option('--missing-image-rate', default=0.0, type=float, help='Fraction of images returning 404.')
+@click.option('--max-payload', default=None, type=int, help='Maximum request size (bytes).')
+@click_log.simple_verbosity_option(logger)
+def main(port, latency, image_latency, error_rate, missing_image_rate, max_payload):
+    server = StubServer(port=port, latency=latency, image_latency=image_latency,
+                        error_rate=error_rate, missing_image_rate=missing_image_rate,
+                        max_payload=max_payload)
+    logger.info('Stub API listening on %s', server.endpoint)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    click_log.basic_config(logger)
+    main()
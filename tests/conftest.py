@@ -0,0 +1,117 @@
+import csv
+import time
+import random
+
+import pytest
+
+
+# Synthetic dataset size - families x species x voucher rows per species
+FAMILIES = 20
+SPECIES = 25
+ROWS = 10
+
+dwca_fields = [
+    'typeStatus', 'catalogNumber', 'individualCount', 'taxonConceptID',
+    'scientificName', 'family', 'genus', 'subgenus', 'specificEpithet',
+    'scientificNameAuthorship', 'locality', 'locationRemarks',
+    'decimalLatitude', 'decimalLongitude', 'maximumDepthInMeters',
+    'eventDate', 'samplingProtocol', 'kingdom', 'country',
+]
+
+
+def _write_csv(path, fields, rows):
+    with open(str(path), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fields, quoting=csv.QUOTE_ALL)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _dwca_rows(rng):
+    catalog_number = 0
+    for family_index in range(FAMILIES):
+        family = 'Synthidae{}'.format(family_index)
+        for species_index in range(SPECIES):
+            genus = 'Synthus{}'.format(family_index)
+            epithet = 'species{}'.format(species_index)
+            for _ in range(ROWS):
+                station = rng.randint(1, 200)
+                yield {
+                    'typeStatus': 'Voucher',
+                    'catalogNumber': 'SYN {}'.format(catalog_number),
+                    'individualCount': str(rng.randint(1, 20)),
+                    'taxonConceptID': '{} {} Author, 1900'.format(genus, epithet),
+                    'scientificName': '{} {}'.format(genus, epithet),
+                    'family': family,
+                    'genus': genus,
+                    'subgenus': '',
+                    'specificEpithet': epithet,
+                    'scientificNameAuthorship': 'Author, 1900',
+                    'locality': 'Station {}'.format(station),
+                    'locationRemarks': 'Muddy sand with shell fragments,\n'
+                                       'sampled at station {}. '.format(station) * 4,
+                    'decimalLatitude': '{:.4f}'.format(rng.uniform(-53, -50)),
+                    'decimalLongitude': '{:.4f}'.format(rng.uniform(-62, -57)),
+                    'maximumDepthInMeters': str(rng.randint(10, 500)),
+                    'eventDate': '2011-{:02d}-{:02d}'.format(rng.randint(1, 12), rng.randint(1, 28)),
+                    'samplingProtocol': rng.choice(['grab', 'trawl', 'dredge']),
+                    'kingdom': 'Animalia',
+                    'country': 'Falkland Islands',
+                }
+                catalog_number += 1
+
+
+def _description_rows():
+    for family_index in range(FAMILIES):
+        family = 'Synthidae{}'.format(family_index)
+        yield {
+            'Title': '{} Author, 1900'.format(family),
+            'Body': '<p><strong>Remarks. </strong>Family {} remarks.</p>'.format(family),
+            'Classification': '{} Author, 1900'.format(family),
+            'Nid': str(family_index),
+            'Term ID': str(family_index),
+            'Rank': 'Family',
+            'UUID': '',
+        }
+
+
+@pytest.fixture(scope='session')
+def synthetic_dataset(tmp_path_factory):
+    """
+    Source exports for a large synthetic dataset - returns a dict of
+    TaxonTreatments file arguments
+    """
+    path = tmp_path_factory.mktemp('synthetic')
+    rng = random.Random(0)
+    _write_csv(path / 'dwca.csv', dwca_fields, _dwca_rows(rng))
+    _write_csv(path / 'descriptions.csv',
+               ['Title', 'Body', 'Classification', 'Nid', 'Term ID', 'Rank', 'UUID'],
+               _description_rows())
+    _write_csv(path / 'images.csv', ['Name', 'TID', 'Description', 'Path'], [])
+    return dict(
+        dwca_file=str(path / 'dwca.csv'),
+        descriptions_file=str(path / 'descriptions.csv'),
+        images_file=str(path / 'images.csv'),
+        parse_workers=1,
+    )
+
+
+@pytest.fixture
+def timer(request):
+    """
+    Benchmark timer - time_fn(name, fn, repeat) calls fn repeat times, and
+    returns (result of the last call, best time in seconds)
+    Times are printed (run pytest with -s to see them) and recorded as
+    test properties
+    """
+    def time_fn(name, fn, repeat=3):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start)
+        best = min(times)
+        print('{}: {:.4g}s'.format(name, best))
+        request.node.user_properties.append((name, best))
+        return result, best
+
+    return time_fn
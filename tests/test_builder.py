@@ -0,0 +1,33 @@
+import pytest
+
+from bdj_import.lib.builder import get_builder
+
+
+schema = '''<?xml version="1.0"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:element name="document">
+    <xs:complexType>
+      <xs:sequence>
+        <xs:element name="title" type="xs:string"/>
+      </xs:sequence>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>
+'''
+
+
+def test_lxml_schema_validation(tmp_path):
+    pytest.importorskip('lxml')
+    xsd_path = str(tmp_path / 'document.xsd')
+    with open(xsd_path, 'w') as f:
+        f.write(schema)
+    builder = get_builder('lxml')
+
+    document = builder.Element('document')
+    builder.SubElement(document, 'title').text = 'Title'
+    assert builder.validate(document, xsd_path) == []
+
+    builder.SubElement(document, 'authors')
+    errors = builder.validate(document, xsd_path)
+    assert len(errors) == 1
+    assert 'authors' in errors[0]
@@ -0,0 +1,26 @@
+from xml.etree import ElementTree
+
+import pytest
+
+from bdj_import.doc import Doc
+from bdj_import.lib.builder import get_builder
+from bdj_import.lib.taxon_treatments import TaxonTreatments
+
+
+def test_builder_benchmark(synthetic_dataset, timer):
+    """
+    Build and serialize the same document with the etree and lxml
+    builders - and check they produce the same XML
+    """
+    pytest.importorskip('lxml')
+    treatments = TaxonTreatments(**synthetic_dataset)
+
+    xml = {}
+    for name in ['etree', 'lxml']:
+        builder = get_builder(name)
+        doc, _ = timer('{} build'.format(name), lambda: Doc(
+            'Synthetic', skip_images=True, builder=builder, treatments=treatments))
+        xml[name], _ = timer('{} serialize'.format(name), lambda: doc.xml)
+
+    assert (ElementTree.canonicalize(xml['etree'].decode('utf-8')) ==
+            ElementTree.canonicalize(xml['lxml'].decode('utf-8')))
@@ -0,0 +1,60 @@
+import os
+
+from bdj_import.lib.distribution import summarize_distributions
+from bdj_import.lib.family_treatment import FamilyTreatment
+from bdj_import.lib.species_treatment import SpeciesTreatment
+from bdj_import.lib.taxon_treatments import TaxonTreatments
+
+
+data_dir = os.path.join(os.path.dirname(__file__), os.pardir, 'bdj_import', 'data')
+
+
+def _family(event_dates):
+    family_treatment = FamilyTreatment(taxon='Synthidae', description=None)
+    species_treatment = SpeciesTreatment(
+        taxon='Synthus species', description=None,
+        taxonomy={'family': 'Synthidae', 'genus': 'Synthus',
+                  'specific_epithet': 'species'})
+    for event_date in event_dates:
+        species_treatment.add_material({
+            'decimalLatitude': '-51.5', 'decimalLongitude': '-59.5',
+            'eventDate': event_date,
+        })
+    family_treatment.add_species(species_treatment)
+    family_treatment.finalize()
+    return family_treatment
+
+
+def test_day_first_dates():
+    family_treatment = _family(['23/04/2012', '1/2/2011'])
+    distributions = summarize_distributions([family_treatment])
+    summary = distributions.get(family_treatment)
+    assert summary['first_date'] == '2011-02-01'
+    assert summary['last_date'] == '2012-04-23'
+
+
+def test_missing_date():
+    family_treatment = _family(['', '01/02/2011'])
+    distributions = summarize_distributions([family_treatment])
+    for treatment in [family_treatment] + list(family_treatment.list_species()):
+        summary = distributions.get(treatment)
+        assert summary['records'] == 2
+        assert summary['first_date'] == summary['last_date'] == '2011-02-01'
+        text, = distributions.describe(treatment)
+        assert 'NaT' not in text
+        assert text.endswith('collected 2011-02-01.')
+
+
+def test_bundled_dates():
+    # Every voucher in the bundled export is dated
+    treatments = TaxonTreatments(
+        dwca_file=os.path.abspath(os.path.join(data_dir, 'falklands-utf8.dwca.csv')),
+        descriptions_file=os.path.abspath(os.path.join(data_dir, 'species-description-export.csv')),
+        images_file=os.path.abspath(os.path.join(data_dir, 'image-export.csv')),
+        parse_workers=1
+    )
+    distributions = summarize_distributions(treatments.values())
+    assert len(distributions)
+    for summary in distributions:
+        assert summary['first_date'] and summary['last_date']
+        assert summary['first_date'] <= summary['last_date']
@@ -0,0 +1,43 @@
+import tracemalloc
+from xml.etree import ElementTree
+
+from bdj_import.doc import Doc
+from bdj_import.lib.taxon_treatments import TaxonTreatments
+
+
+# Memory ceiling for the bounded build of the synthetic dataset
+MAX_MEMORY = 8 * 1024 * 1024
+
+
+def _peak(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_bounded_build_stays_under_memory_ceiling(synthetic_dataset, tmp_path):
+
+    def build_bounded():
+        treatments = TaxonTreatments(lazy=True, **synthetic_dataset)
+        doc = Doc('Synthetic', skip_images=True, bounded=True,
+                  max_memory=MAX_MEMORY, treatments=treatments)
+        with open(str(tmp_path / 'bounded.xml'), 'wb') as f:
+            doc.write(f)
+
+    def build_eager():
+        treatments = TaxonTreatments(**synthetic_dataset)
+        doc = Doc('Synthetic', skip_images=True, treatments=treatments)
+        with open(str(tmp_path / 'eager.xml'), 'wb') as f:
+            f.write(doc.xml)
+
+    # Parsing & building the whole document at once exceeds the ceiling
+    # - so the ceiling is meaningful
+    assert _peak(build_eager) > MAX_MEMORY
+    # Reading the sources, and building family by family, stays under it
+    assert _peak(build_bounded) < MAX_MEMORY
+    # And builds the same document
+    assert (ElementTree.canonicalize(from_file=str(tmp_path / 'bounded.xml')) ==
+            ElementTree.canonicalize(from_file=str(tmp_path / 'eager.xml')))
@@ -0,0 +1,42 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bdj_import.lib.pipeline import Pipeline, Stage
+
+
+def test_shared_executor():
+    threads = set()
+
+    def check(item):
+        threads.add(threading.current_thread().name)
+        # Finish out of order
+        time.sleep(0.001 * (item % 3))
+        return item * 2
+
+    with ThreadPoolExecutor(4, thread_name_prefix='shared') as executor:
+        for _ in range(2):
+            engine = Pipeline([
+                Stage('check', check, workers=4, executor=executor),
+                Stage('build', lambda item: item + 1, ordered=True),
+            ])
+            assert list(engine.run(range(50))) == [i * 2 + 1 for i in range(50)]
+            assert engine.stages[0].count == 50
+
+    # The items are checked by the shared pool's threads
+    assert threads and all(name.startswith('shared') for name in threads)
+
+
+def test_shared_executor_error():
+
+    def check(item):
+        if item == 10:
+            raise ValueError(item)
+        return item
+
+    with ThreadPoolExecutor(4) as executor:
+        engine = Pipeline([Stage('check', check, workers=4, executor=executor)])
+        with pytest.raises(ValueError):
+            list(engine.run(range(50)))
@@ -0,0 +1,51 @@
+import sys
+import tracemalloc
+
+from bdj_import.doc import Doc
+from bdj_import.lib.taxon_treatments import TaxonTreatments
+
+
+def _treatments(taxon_treatments):
+    for family_treatment in taxon_treatments.values():
+        yield family_treatment
+        for species_treatment in family_treatment.list_species():
+            yield species_treatment
+
+
+def test_treatment_memory_benchmark(synthetic_dataset):
+    """
+    Memory per treatment, traced while parsing the synthetic dataset
+    """
+    tracemalloc.start()
+    try:
+        taxon_treatments = TaxonTreatments(**synthetic_dataset)
+        traced = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    treatments = list(_treatments(taxon_treatments))
+    # Slotted - no per object dict
+    assert not any(hasattr(t, '__dict__') for t in treatments)
+    object_size = sum(sys.getsizeof(t) for t in treatments) / len(treatments)
+    print('{} treatments: {:.0f} bytes traced per treatment (with materials), '
+          '{:.0f} bytes per treatment object'.format(
+              len(treatments), traced / len(treatments), object_size))
+
+
+def test_treatment_build_benchmark(synthetic_dataset, timer):
+    """
+    Build time of the synthetic dataset - derived fields are computed once
+    when the treatments are finalized, rather than on each access
+    """
+    taxon_treatments, _ = timer('parse', lambda: TaxonTreatments(**synthetic_dataset))
+    species = [s for t in taxon_treatments.values() for s in t.list_species()]
+
+    def access():
+        for s in species:
+            s.species, s.genus, s.subgenus, s.taxon_authors, s.notes, s.diagnosis
+
+    timer('field access ({} species)'.format(len(species)), access)
+    timer('build', lambda: Doc('Synthetic', skip_images=True,
+                               treatments=taxon_treatments))
+    assert species[0].genus == 'Synthus0'
+    assert species[0].taxon_authors == '(Author, 1900)'